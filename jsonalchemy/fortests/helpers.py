@@ -40,3 +40,7 @@ def schema_title(field):
 
 def raise_error(field, name, value):
     raise NotImplementedError("We can't process %s" % name)
+
+
+def author_names(field):
+    return '; '.join(author['family_name'] for author in field['authors'])
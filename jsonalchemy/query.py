@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""JSONPath queries."""
+
+from __future__ import unicode_literals
+
+from multiprocessing import Pool
+
+from jsonpath_rw import parse
+
+from .utils import LRUCache
+from .utils import bounded_imap
+from .utils import chunked
+
+# Parsed queries, keyed by their source.
+query_cache = LRUCache(maxsize=128)
+
+
+class Query(object):
+
+    """JSONPath expression parsed once and applicable to many records."""
+
+    def __init__(self, query):
+        self.query = query
+        self.expression = parse(query)
+
+    def __reduce__(self):
+        return compile_query, (self.query,)
+
+    def find(self, data):
+        """Return the matches of the query in ``data``."""
+        return self.expression.find(data)
+
+    def values(self, data):
+        """Return the values matched by the query in ``data``."""
+        return [match.value for match in self.expression.find(data)]
+
+
+def compile_query(query):
+    """Return the parsed ``query``, parsing the same source only once."""
+    if isinstance(query, Query):
+        return query
+    compiled = query_cache.get(query)
+    if compiled is None:
+        compiled = query_cache[query] = Query(query)
+    return compiled
+
+
+def search_many(records, query, processes=None, chunksize=100):
+    """Apply ``query`` to many records.
+
+    ``records`` may contain wrappers as well as plain dicts and lists.
+    Matches are yielded lazily as ``(index, path, value)`` tuples, where
+    ``index`` is the position of the record in ``records``; values are
+    returned as found, without being wrapped.
+
+    With ``processes`` the records are searched in chunks of ``chunksize``
+    by a pool of processes, in which case they must be picklable.
+    """
+    query = compile_query(query)
+    if not processes:
+        return _search(query, enumerate(records))
+    return _search_parallel(query, records, processes, chunksize)
+
+
+def _search(query, indexed_records):
+    for index, record in indexed_records:
+        for match in query.find(record):
+            yield index, str(match.full_path), match.value
+
+
+def _search_chunk(args):
+    query, indexed_records = args
+    return list(_search(query, indexed_records))
+
+
+def _search_parallel(query, records, processes, chunksize):
+    pool = Pool(processes)
+    try:
+        tasks = ((query, chunk) for chunk in
+                 chunked(enumerate(records), chunksize))
+        for matches in bounded_imap(pool, _search_chunk, tasks,
+                                    2 * processes):
+            for match in matches:
+                yield match
+    finally:
+        pool.terminate()
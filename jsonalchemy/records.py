@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Bulk processing of records."""
+
+from __future__ import unicode_literals
+
+import codecs
+import json
+
+from multiprocessing import Pool
+
+from jsonschema import ValidationError
+
+from .schema import compile_schema
+from .utils import bounded_imap
+from .utils import chunked
+from .utils import json_loads
+from .validators import get_validator
+from .wrappers import JSONBase
+from .wrappers import JSONView
+from .wrappers import wrap
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = ' \t\n\r'
+
+# Characters that can go on a number.
+_NUMBER = '0123456789+-.eE'
+
+# Schema used by the worker processes of ``validate_many``.
+_worker_schema = None
+
+
+def iter_records(fileobj, schema=None, format='jsonl', validate=False,
+                 lazy=False, compact=False, bufsize=65536):
+    """Yield the records read from ``fileobj`` one at a time.
+
+    ``format`` is either ``'jsonl'``, one document per line, or ``'array'``,
+    a single top-level array read incrementally, ``bufsize`` characters at a
+    time.  Only the current record is kept in memory.  Every record is
+    wrapped with the same compiled ``schema`` and, with ``validate``,
+    validated before being yielded.
+    """
+    if format == 'jsonl':
+        documents = _iter_lines(fileobj)
+    elif format == 'array':
+        documents = _iter_array(fileobj, bufsize)
+    else:
+        raise ValueError('Unknown format %s.' % format)
+
+    schema = compile_schema(schema or {})
+    for document in documents:
+        record = wrap(document, schema, lambda: None, lambda: None, lazy,
+                      compact)
+        if validate:
+            if isinstance(record, JSONBase):
+                record.validate()
+            else:
+                get_validator(schema).validate(record)
+        yield record
+
+
+def _iter_lines(fileobj):
+    for line in fileobj:
+        if line.strip():
+            yield json_loads(line)
+
+
+def _iter_array(fileobj, bufsize):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    reader = _Reader(fileobj, decoder, bufsize)
+    if reader.next_char() != '[':
+        raise ValueError('The JSON document is not an array.')
+    reader.position += 1
+    if reader.next_char() == ']':
+        return
+    while True:
+        yield reader.decode()
+        char = reader.next_char()
+        reader.position += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError('Expecting , delimiter at position %d.' %
+                             (reader.offset + reader.position - 1))
+
+
+class _Reader(object):
+
+    """Buffer over a file, holding at most one undecoded record."""
+
+    def __init__(self, fileobj, decoder, bufsize):
+        self.fileobj = fileobj
+        self.decoder = decoder
+        self.bufsize = bufsize
+        self.buffer = ''
+        self.position = 0
+        self.offset = 0
+        self.eof = False
+
+    def read(self, size):
+        chunk = self.fileobj.read(size)
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            self.eof = True
+        # Drop what was consumed already.
+        self.offset += self.position
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+
+    def next_char(self):
+        """Return the next character that is not whitespace."""
+        while True:
+            while self.position < len(self.buffer) and \
+                    self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                raise ValueError('Unexpected end of the JSON document.')
+            self.read(self.bufsize)
+
+    def decode(self):
+        """Decode the value starting at the current position."""
+        size = self.bufsize
+        while True:
+            first = self.next_char()
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+                # A number may go on in the next chunk, even after a ``.``
+                # or an exponent that was left out of the decoded value.
+                if first not in _NUMBER or self.eof or \
+                        (end < len(self.buffer) and
+                         self.buffer[end] not in _NUMBER):
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # Read more at a time for large records so they are not decoded
+            # again after every chunk.
+            self.read(size)
+            size *= 2
+
+
+def validate_many(records, schema=None, workers=None, chunksize=100):
+    """Validate many records against ``schema``.
+
+    Yields, in the order of ``records``, ``None`` for every valid record and
+    the ``ValidationError`` of every invalid one.  Records are read lazily.
+
+    With ``workers`` the records are validated in chunks of ``chunksize`` by
+    a pool of processes.  The compiled schema is sent to each worker once,
+    at startup, and at most two chunks per worker are in flight at any
+    time.  Records must then be plain, picklable JSON values.
+    """
+    schema = compile_schema(schema or {})
+    if not workers:
+        return (_validate(record, schema) for record in records)
+    return _validate_parallel(records, schema, workers, chunksize)
+
+
+def _validate(record, schema):
+    try:
+        # The schema is checked first so that external validators only see
+        # records of the right types.
+        get_validator(schema).validate(record)
+        if not isinstance(record, JSONBase):
+            if isinstance(record, (dict, list)):
+                record = JSONView(record, schema)
+            else:
+                record = wrap(record, schema, lambda: None, lambda: None)
+        if isinstance(record, JSONBase):
+            record._validate_external()
+    except ValidationError as error:
+        return error
+
+
+def _init_worker(schema):
+    global _worker_schema
+    _worker_schema = schema
+
+
+def _validate_chunk(records):
+    results = []
+    for record in records:
+        error = _validate(record, _worker_schema)
+        if error is not None:
+            # Errors can't be pickled as they are.
+            error = {'message': error.message, 'path': list(error.path),
+                     'schema_path': list(error.schema_path)}
+        results.append(error)
+    return results
+
+
+def _validate_parallel(records, schema, workers, chunksize):
+    pool = Pool(workers, _init_worker, (schema,))
+    try:
+        for errors in bounded_imap(pool, _validate_chunk,
+                                   chunked(records, chunksize),
+                                   2 * workers):
+            for error in errors:
+                yield error if error is None else ValidationError(**error)
+    finally:
+        pool.terminate()
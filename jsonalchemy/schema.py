@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Compiled schemas.
+
+A schema is compiled once: every ``$ref`` is resolved and the whole tree is
+frozen, so the result can be shared by any number of wrappers without being
+walked again.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import json
+import os
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+from jsonschema import RefResolutionError
+from requests import Session
+from requests import exceptions
+from requests.adapters import HTTPAdapter
+from six import iteritems
+from six import itervalues
+from six.moves.urllib.parse import unquote
+from six.moves.urllib.parse import urldefrag
+from six.moves.urllib.parse import urljoin
+
+from .utils import LRUCache
+
+# Keywords holding a single subschema.
+SCHEMA_KEYWORDS = ('additionalItems', 'additionalProperties', 'items', 'not')
+# Keywords holding a list of subschemas.
+SCHEMA_LIST_KEYWORDS = ('allOf', 'anyOf', 'items', 'oneOf')
+# Keywords holding a mapping of subschemas.
+SCHEMA_DICT_KEYWORDS = ('definitions', 'dependencies', 'patternProperties',
+                        'properties')
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError('%s is immutable.' % self.__class__.__name__)
+
+
+def _same(self, memo=None):
+    # Frozen values are never modified, so copies can share them.
+    return self
+
+
+class FrozenDict(dict):
+
+    """Read-only ``dict`` used for the nodes of a compiled schema."""
+
+    _frozen = False
+
+    def _freeze(self):
+        self._frozen = True
+        return self
+
+    def _check(self):
+        if self._frozen:
+            _immutable(self)
+
+    def __setitem__(self, key, value):
+        self._check()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._check()
+        dict.__delitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        self._check()
+        dict.update(self, *args, **kwargs)
+
+    clear = pop = popitem = setdefault = _immutable
+    __copy__ = __deepcopy__ = _same
+
+
+class FrozenList(list):
+
+    """Read-only ``list`` used for the arrays of a compiled schema."""
+
+    _frozen = False
+
+    def _freeze(self):
+        self._frozen = True
+        return self
+
+    def append(self, value):
+        if self._frozen:
+            _immutable(self)
+        list.append(self, value)
+
+    def extend(self, values):
+        if self._frozen:
+            _immutable(self)
+        list.extend(self, values)
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = insert = pop = remove = reverse = sort = _immutable
+    __copy__ = __deepcopy__ = _same
+
+
+class CompiledSchema(FrozenDict):
+
+    """Root of a schema whose references have been resolved.
+
+    Wrappers accept it directly as their ``schema`` and never walk it again.
+    """
+
+
+def freeze(value):
+    """Return a read-only deep copy of a JSON value."""
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        node = FrozenDict()
+        for key, item in iteritems(value):
+            dict.__setitem__(node, key, freeze(item))
+        return node._freeze()
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)._freeze()
+    return value
+
+
+def iter_refs(schema):
+    """Yield every ``$ref`` found in the subschemas of ``schema``."""
+    stack = [schema]
+    seen = set()
+    while stack:
+        schema = stack.pop()
+        if not isinstance(schema, dict) or id(schema) in seen:
+            continue
+        seen.add(id(schema))
+        if '$ref' in schema:
+            yield schema['$ref']
+            continue
+        for key, value in iteritems(schema):
+            if key in SCHEMA_KEYWORDS and isinstance(value, dict):
+                stack.append(value)
+            elif key in SCHEMA_LIST_KEYWORDS and isinstance(value, list):
+                stack.extend(value)
+            elif key in SCHEMA_DICT_KEYWORDS and isinstance(value, dict):
+                stack.extend(itervalues(value))
+
+
+class RefResolver(object):
+
+    """Fetch the documents of remote references.
+
+    Documents are kept in an in-memory LRU cache and, if ``cache_dir`` is
+    given, on disk together with their ETag so later processes only need a
+    conditional request.  In ``offline`` mode nothing is downloaded and
+    documents missing from the caches raise a ``RefResolutionError``.
+    Up to ``workers`` documents are downloaded concurrently by
+    :meth:`prefetch`.  A document that can neither be downloaded nor found
+    in the caches raises a ``RefResolutionError`` as well.
+    """
+
+    def __init__(self, cache_dir=None, maxsize=128, offline=False,
+                 timeout=10, session=None, workers=8):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.timeout = timeout
+        self.workers = workers
+        if session is None:
+            session = Session()
+            adapter = HTTPAdapter(pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.cache = LRUCache(maxsize)
+
+    def prefetch(self, schema, base=''):
+        """Fetch every remote document ``schema`` refers to, transitively.
+
+        Documents are downloaded in parallel so that compiling the schema
+        afterwards only hits the cache.
+        """
+        seen = set()
+        pending = self._missing(schema, base, seen)
+        pool = None
+        try:
+            while pending:
+                if len(pending) == 1:
+                    documents = [self.resolve(pending[0])]
+                else:
+                    if pool is None:
+                        pool = ThreadPool(self.workers)
+                    documents = pool.map(self.resolve, pending)
+                fetched, pending = pending, []
+                for url, document in zip(fetched, documents):
+                    pending.extend(self._missing(document, url, seen))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _missing(self, schema, base, seen):
+        urls = []
+        for ref in iter_refs(schema):
+            url = urljoin(base, urldefrag(ref)[0])
+            if url and url != base and url not in seen:
+                seen.add(url)
+                document = self.cache.get(url)
+                if document is None:
+                    urls.append(url)
+                else:
+                    urls.extend(self._missing(document, url, seen))
+        return urls
+
+    def resolve(self, url):
+        """Return the document at ``url``."""
+        document = self.cache.get(url)
+        if document is not None:
+            return document
+
+        entry = self._load(url)
+        if self.offline:
+            if entry is None:
+                raise RefResolutionError('%s is not cached' % url)
+            document = entry['document']
+        else:
+            document = self._fetch(url, entry)
+            if document is None:
+                raise RefResolutionError('%s could not be fetched' % url)
+        self.cache[url] = document
+        return document
+
+    def _fetch(self, url, entry):
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        try:
+            response = self.session.get(url, headers=headers,
+                                        timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                return entry['document']
+            response.raise_for_status()
+            document = json.loads(response.text)
+        except (exceptions.RequestException, ValueError):
+            # Serve a stale copy rather than nothing.
+            return entry['document'] if entry is not None else None
+        self._store(url, response.headers.get('ETag'), document)
+        return document
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.json')
+
+    def _load(self, url):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(url), 'r') as cache_file:
+                entry = json.load(cache_file)
+        except (IOError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def _store(self, url, etag, document):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as error:
+            # Another thread may have created it meanwhile.
+            if error.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so concurrent readers never see a
+        # partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump({'url': url, 'etag': etag, 'document': document},
+                      cache_file)
+        os.rename(tmp_path, self._path(url))
+
+
+default_resolver = RefResolver()
+
+
+def resolve_pointer(document, pointer):
+    """Return the part of ``document`` that the JSON ``pointer`` points to."""
+    target = document
+    if not pointer:
+        return target
+    for part in unquote(pointer).split('/')[1:]:
+        part = part.replace('~1', '/').replace('~0', '~')
+        try:
+            if isinstance(target, list):
+                part = int(part)
+            target = target[part]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise KeyError("Path %s is not accessible" % pointer)
+    return target
+
+
+class _SchemaCompiler(object):
+
+    def __init__(self, document, resolver, base='', nodes=None,
+                 resolving=None):
+        self.document = document
+        self.resolver = resolver
+        self.base = base
+        # Compiled nodes by identity of their source, shared between the
+        # documents of one compilation so every subschema is compiled once
+        # and recursive references point back to the same node.
+        self.nodes = {} if nodes is None else nodes
+        # References being resolved, shared as well so that cycles going
+        # through several documents are detected.
+        self.resolving = set() if resolving is None else resolving
+
+    def compile(self, schema):
+        if isinstance(schema, (FrozenDict, FrozenList)):
+            return schema
+        if not isinstance(schema, dict):
+            return freeze(schema)
+        try:
+            return self.nodes[id(schema)][1]
+        except KeyError:
+            pass
+        if '$ref' in schema:
+            if id(schema) in self.resolving:
+                raise RefResolutionError('Circular reference %s' %
+                                         schema['$ref'])
+            self.resolving.add(id(schema))
+            try:
+                node = self.resolve(schema['$ref'])
+            finally:
+                self.resolving.discard(id(schema))
+        else:
+            node = FrozenDict()
+            # Register the node before filling it so recursive schemas
+            # point back to it instead of being expanded forever.
+            self.nodes[id(schema)] = (schema, node)
+            self.fill(node, schema)
+        self.nodes[id(schema)] = (schema, node)
+        return node
+
+    def fill(self, node, schema):
+        for key, value in iteritems(schema):
+            if key in SCHEMA_KEYWORDS and isinstance(value, dict):
+                value = self.compile(value)
+            elif key in SCHEMA_LIST_KEYWORDS and isinstance(value, list):
+                value = FrozenList(self.compile(v) for v in value)._freeze()
+            elif key in SCHEMA_DICT_KEYWORDS and isinstance(value, dict):
+                value = FrozenDict((k, self.compile(v)) for (k, v) in
+                                   iteritems(value))._freeze()
+            else:
+                value = freeze(value)
+            dict.__setitem__(node, key, value)
+        return node._freeze()
+
+    def resolve(self, ref):
+        url, fragment = urldefrag(ref)
+        url = urljoin(self.base, url)
+        if not url or url == self.base:
+            compiler = self
+        else:
+            compiler = _SchemaCompiler(self.resolver.resolve(url),
+                                       self.resolver, url, self.nodes,
+                                       self.resolving)
+        return compiler.compile(resolve_pointer(compiler.document, fragment))
+
+
+def compile_schema(schema, resolver=None):
+    """Resolve all references in ``schema`` and freeze it.
+
+    Remote references are prefetched concurrently with ``resolver``, by
+    default ``default_resolver``.  The given schema is not modified.
+    Compiling an already compiled schema returns it unchanged.
+    """
+    if isinstance(schema, CompiledSchema):
+        return schema
+    resolver = resolver or default_resolver
+    resolver.prefetch(schema)
+    node = _SchemaCompiler(schema, resolver).compile(schema or {})
+    if isinstance(node, dict):
+        compiled = CompiledSchema()
+        dict.update(compiled, node)
+        return compiled._freeze()
+    return node
@@ -23,14 +23,139 @@
 
 """Utils."""
 
+import itertools
 import json
+import threading
 
-from jsonschema import Draft4Validator
+from collections import OrderedDict
+from collections import deque
+
+from six import text_type
+from werkzeug.utils import import_string
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = None
+
+
+class LRUCache(object):
+
+    """Thread-safe mapping keeping only the most recently used entries."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_import_cache = {}
+
+
+def cached_import_string(path):
+    """Import the object at the dotted ``path`` once and reuse it."""
+    try:
+        return _import_cache[path]
+    except KeyError:
+        obj = _import_cache[path] = import_string(path)
+        return obj
+
+
+def clear_import_cache():
+    """Forget imported hooks, e.g. after their modules have been reloaded."""
+    _import_cache.clear()
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` consecutive items of ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_imap(pool, func, iterable, window):
+    """Like ``pool.imap`` but with at most ``window`` tasks in flight.
+
+    Items are only taken from ``iterable`` as results are consumed, so
+    arbitrarily long inputs run in constant memory.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def get_from_path(path, holder, delimiter="."):
+    """Return the value found at ``path`` inside ``holder``."""
+    current = holder
+    for key in path.split(delimiter):
+        try:
+            current = current[key]
+        except KeyError:
+            raise KeyError("Path %s is not accessible" % path)
+    return current
+
+
+def json_loads(data):
+    """Decode a JSON document given as bytes or text.
+
+    The faster ``orjson`` decoder is used when it is installed.
+    """
+    if _loads is not None:
+        return _loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def json_pointer(path):
+    """Return the JSON pointer of the value found at ``path``."""
+    return ''.join('/' + text_type(key).replace('~', '~0').replace('/', '~1')
+                   for key in path)
 
 
 def load_schema_from_url(schema_url):
     with open(schema_url, "r") as schema_file:
         schema = json.loads(schema_file.read())
-        validator = Draft4Validator(schema)
 
     return schema
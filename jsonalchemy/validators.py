@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Validators."""
+
+from __future__ import unicode_literals
+
+import numbers
+
+from jsonschema import Draft4Validator
+from jsonschema import ValidationError
+from jsonschema._utils import flatten
+from jsonschema.exceptions import UnknownType
+from jsonschema.validators import extend
+from six import binary_type
+from six import string_types
+
+from .schema import FrozenDict
+from .schema import FrozenList
+from .schema import freeze
+from .utils import LRUCache
+
+# Wrappers subclass the builtin types, so these cover them as well.  Strings
+# decoded on Python 2 are unicode.
+TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': string_types,
+    'number': (int, float),
+    'integer': (int,),
+}
+
+_type_checker = Draft4Validator({}, types=TYPES)
+
+# Keywords checked by the generated code.  A schema using any other keyword
+# known to Draft4Validator is checked by the validator itself.
+COMPILED_KEYWORDS = frozenset([
+    'additionalItems', 'enum', 'items', 'maxItems', 'maxLength',
+    'maxProperties', 'maximum', 'minItems', 'minLength', 'minProperties',
+    'minimum', 'properties', 'required', 'type',
+])
+
+# Keywords of the checks done by Python functions rather than by the schema.
+EXTERNAL_KEYWORDS = ('validation', 'enumSource')
+
+# Validators of compiled schemas, keyed by the identity of the schema.
+validator_cache = LRUCache(maxsize=256)
+
+# Shallow versions of compiled schemas, keyed by the identity of the schema.
+shallow_cache = LRUCache(maxsize=256)
+
+# Indexes of the enums of compiled schemas, keyed by the identity of the enum.
+enum_cache = LRUCache(maxsize=256)
+
+_use_compiled = False
+
+
+def enable_compiled_validators(enabled=True):
+    """Validate compiled schemas with generated code."""
+    global _use_compiled
+    _use_compiled = enabled
+
+
+def get_validator(schema):
+    """Return a validator for ``schema``.
+
+    Validators of compiled schemas are cached, any other schema may still
+    change and gets a new ``Draft4Validator``.
+    """
+    if not isinstance(schema, FrozenDict):
+        return Draft4Validator(schema=schema, types=TYPES)
+    key = (id(schema), _use_compiled)
+    # The cached entry keeps the schema alive, so its id can not be reused.
+    entry = validator_cache.get(key)
+    if entry is None:
+        if _use_compiled:
+            validator = CompiledValidator(schema)
+        else:
+            validator = Draft4Validator(schema=schema, types=TYPES)
+        entry = validator_cache[key] = (schema, validator)
+    return entry[1]
+
+
+def shallow_schema(schema):
+    """Return ``schema`` without the subschemas of properties and items.
+
+    It checks a value but not what ``properties`` and ``items`` say about
+    its children.  Their names and number are kept, so
+    ``additionalProperties`` and ``additionalItems`` still apply.
+    """
+    if isinstance(schema, FrozenDict):
+        entry = shallow_cache.get(id(schema))
+        if entry is not None:
+            return entry[1]
+    shallow = dict(schema)
+    if isinstance(schema.get('properties'), dict):
+        shallow['properties'] = dict.fromkeys(schema['properties'], {})
+    if isinstance(schema.get('items'), dict):
+        shallow['items'] = {}
+    elif isinstance(schema.get('items'), list):
+        shallow['items'] = [{}] * len(schema['items'])
+    if isinstance(schema, FrozenDict):
+        shallow = freeze(shallow)
+        shallow_cache[id(schema)] = (schema, shallow)
+    return shallow
+
+
+def has_type(instance, schema):
+    """Tell if ``instance`` is of one of the types allowed by ``schema``."""
+    types = schema.get('type')
+    if types is None:
+        return True
+    if not isinstance(types, list):
+        types = [types]
+    for type_ in types:
+        try:
+            if _type_checker.is_type(instance, type_):
+                return True
+        except UnknownType:
+            return True
+    return False
+
+
+def get_enum_index(enum):
+    """Return an index telling quickly whether a value is in ``enum``.
+
+    Indexes of compiled enums are cached.
+    """
+    if not isinstance(enum, FrozenList):
+        return EnumIndex(enum)
+    entry = enum_cache.get(id(enum))
+    if entry is None:
+        entry = enum_cache[id(enum)] = (enum, EnumIndex(enum))
+    return entry[1]
+
+
+class EnumIndex(object):
+
+    """Set of the values of an enum, compared as JSON values.
+
+    Booleans are not numbers, integers equal the same floats and strings
+    are equal whether they are encoded or not.  Arrays and objects can't be
+    hashed and are looked up one by one.
+    """
+
+    def __init__(self, values):
+        self.keys = set()
+        self.unhashable = []
+        for value in values:
+            try:
+                self.keys.add(_enum_key(value))
+            except TypeError:
+                self.unhashable.append(value)
+
+    def __contains__(self, value):
+        try:
+            return _enum_key(value) in self.keys
+        except TypeError:
+            return value in self.unhashable
+
+
+def _enum_key(value):
+    if isinstance(value, bool):
+        return ('boolean', value)
+    if isinstance(value, numbers.Number):
+        return ('number', value)
+    if isinstance(value, binary_type):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    if isinstance(value, string_types):
+        return ('string', value)
+    return (None, value)
+
+
+def _external(keyword):
+    def check(validator, value, instance, schema):
+        # Values of the wrong type are reported by the ``type`` keyword and
+        # would only make external validators fail.
+        if not hasattr(instance, '_check_external') or \
+                not has_type(instance, schema):
+            return
+        try:
+            instance._check_external(keyword)
+        except ValidationError as error:
+            yield error
+    return check
+
+
+ReportValidator = extend(Draft4Validator, dict(
+    (keyword, _external(keyword)) for keyword in EXTERNAL_KEYWORDS))
+
+
+def get_report_validator(schema):
+    """Return a validator reporting the errors of external checks as well.
+
+    External checks need wrappers: plain values are not checked.
+    """
+    if not isinstance(schema, FrozenDict):
+        return ReportValidator(schema=schema, types=TYPES)
+    key = (id(schema), 'report')
+    entry = validator_cache.get(key)
+    if entry is None:
+        validator = ReportValidator(schema=schema, types=TYPES)
+        entry = validator_cache[key] = (schema, validator)
+    return entry[1]
+
+
+class CompiledValidator(object):
+
+    """Validator running Python code generated from the schema.
+
+    The generated code only tells whether an instance is valid.  Errors are
+    reported by a ``Draft4Validator``, so they are exactly the same.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.validator = Draft4Validator(schema=schema, types=TYPES)
+        self.check = _CodeGenerator(self.validator).generate(schema)
+
+    def is_valid(self, instance):
+        return self.check(instance)
+
+    def iter_errors(self, instance):
+        if self.check(instance):
+            return iter(())
+        return self.validator.iter_errors(instance)
+
+    def validate(self, instance):
+        if not self.check(instance):
+            self.validator.validate(instance)
+
+
+class _CodeGenerator(object):
+
+    def __init__(self, validator):
+        self.types = dict(Draft4Validator.DEFAULT_TYPES)
+        self.types.update(TYPES)
+        self.namespace = {'_fallback': validator.is_valid}
+        self.names = {}
+        self.pending = []
+
+    def generate(self, schema):
+        entry = self.function(schema)
+        lines = []
+        while self.pending:
+            lines.extend(self.body(*self.pending.pop()))
+        exec(compile('\n'.join(lines), '<schema>', 'exec'), self.namespace)
+        return self.namespace[entry]
+
+    def function(self, schema):
+        try:
+            return self.names[id(schema)]
+        except KeyError:
+            name = self.names[id(schema)] = '_v%d' % len(self.names)
+            self.pending.append((name, schema))
+            return name
+
+    def constant(self, value):
+        name = '_c%d' % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def is_type(self, name):
+        pytypes = self.types[name]
+        check = 'isinstance(x, %s)' % self.constant(pytypes)
+        flat = flatten(pytypes)
+        if bool not in flat and \
+                any(issubclass(t, numbers.Number) for t in flat):
+            # bool inherits from int, but booleans are not numbers.
+            check = '%s and not isinstance(x, bool)' % check
+        return check
+
+    def body(self, name, schema):
+        types = []
+        if isinstance(schema, dict):
+            types = schema.get('type', [])
+            types = [types] if not isinstance(types, list) else types
+        if not isinstance(schema, dict) or \
+                set(schema) & set(Draft4Validator.VALIDATORS) - \
+                COMPILED_KEYWORDS or \
+                any(t not in self.types for t in types):
+            return ['def %s(x):' % name,
+                    '    return _fallback(x, %s)' % self.constant(schema)]
+
+        lines = ['def %s(x):' % name]
+        if types:
+            lines += ['    if not (%s):' % ' or '.join(
+                          '(%s)' % self.is_type(t) for t in types),
+                      '        return False']
+        lines += self.object_checks(schema)
+        lines += self.array_checks(schema)
+        lines += self.string_checks(schema)
+        lines += self.number_checks(schema)
+        if 'enum' in schema:
+            lines += ['    if x not in %s:' % self.constant(schema['enum']),
+                      '        return False']
+        lines.append('    return True')
+        return lines
+
+    def block(self, type_name, checks):
+        if not checks:
+            return []
+        return ['    if %s:' % self.is_type(type_name)] + \
+            ['        ' + line for line in checks]
+
+    def object_checks(self, schema):
+        checks = []
+        if 'required' in schema:
+            checks += ['for p in %s:' % self.constant(schema['required']),
+                       '    if p not in x:',
+                       '        return False']
+        if 'minProperties' in schema:
+            checks += ['if len(x) < %r:' % schema['minProperties'],
+                       '    return False']
+        if 'maxProperties' in schema:
+            checks += ['if len(x) > %r:' % schema['maxProperties'],
+                       '    return False']
+        for key, subschema in sorted(schema.get('properties', {}).items()):
+            key = self.constant(key)
+            checks += ['if %s in x and not %s(x[%s]):' % (
+                           key, self.function(subschema), key),
+                       '    return False']
+        return self.block('object', checks)
+
+    def array_checks(self, schema):
+        checks = []
+        if 'minItems' in schema:
+            checks += ['if len(x) < %r:' % schema['minItems'],
+                       '    return False']
+        if 'maxItems' in schema:
+            checks += ['if len(x) > %r:' % schema['maxItems'],
+                       '    return False']
+        items = schema.get('items', {})
+        if isinstance(items, dict):
+            if 'items' in schema:
+                checks += ['for e in x:',
+                           '    if not %s(e):' % self.function(items),
+                           '        return False']
+        else:
+            for index, subschema in enumerate(items):
+                checks += ['if len(x) > %d and not %s(x[%d]):' % (
+                               index, self.function(subschema), index),
+                           '    return False']
+            additional = schema.get('additionalItems', True)
+            if additional is False:
+                checks += ['if len(x) > %d:' % len(items),
+                           '    return False']
+            elif isinstance(additional, dict):
+                checks += ['for e in x[%d:]:' % len(items),
+                           '    if not %s(e):' % self.function(additional),
+                           '        return False']
+        return self.block('array', checks)
+
+    def string_checks(self, schema):
+        checks = []
+        if 'minLength' in schema:
+            checks += ['if len(x) < %r:' % schema['minLength'],
+                       '    return False']
+        if 'maxLength' in schema:
+            checks += ['if len(x) > %r:' % schema['maxLength'],
+                       '    return False']
+        return self.block('string', checks)
+
+    def number_checks(self, schema):
+        checks = []
+        if 'minimum' in schema:
+            operator = '<=' if schema.get('exclusiveMinimum') else '<'
+            checks += ['if x %s %s:' % (operator,
+                                        self.constant(schema['minimum'])),
+                       '    return False']
+        if 'maximum' in schema:
+            operator = '>=' if schema.get('exclusiveMaximum') else '>'
+            checks += ['if x %s %s:' % (operator,
+                                        self.constant(schema['maximum'])),
+                       '    return False']
+        return self.block('number', checks)
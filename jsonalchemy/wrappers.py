@@ -23,31 +23,87 @@
 
 from __future__ import unicode_literals
 
-import json
+import itertools
 import weakref
 
+from json.encoder import encode_basestring_ascii
 from jinja import Environment
-from jsonpath_rw import parse
-from jsonschema import Draft4Validator
 from jsonschema import ValidationError
-from requests import exceptions
-from requests import get
+from jsonpath_rw import Fields
+from jsonpath_rw import Index
+from six import get_unbound_function
+from six import integer_types
 from six import iteritems
 from six import itervalues
-from werkzeug.utils import import_string
+from six import string_types
+from six import text_type
 
+from .query import compile_query
+from .schema import FrozenDict
+from .schema import compile_schema
+from .utils import LRUCache
+from .utils import cached_import_string
+from .utils import get_from_path
+from .utils import json_loads
+from .utils import json_pointer
+from .validators import EXTERNAL_KEYWORDS
+from .validators import get_enum_index
+from .validators import get_report_validator
+from .validators import get_validator
+from .validators import has_type
+from .validators import shallow_schema
 
-def wrap(value, value_schema, root, parent):
+environment = Environment()
+
+# Source of the stamps recording when wrappers were last changed.
+_clock = itertools.count(1)
+
+# Parsed templates of derived fields, keyed by their source.
+template_cache = LRUCache(maxsize=256)
+
+# Open ``validation`` transactions, innermost last.
+_transactions = []
+
+# Marks keys that were missing in undo records.
+_missing = object()
+
+# Names of the calculated fields of compiled schemas, keyed by their identity.
+calculated_cache = LRUCache(maxsize=256)
+
+try:
+    from orjson import dumps as _fast_dumps
+except ImportError:
+    _fast_dumps = None
+
+
+def get_template(source):
+    """Return the template for ``source``, parsing it only once."""
+    template = template_cache.get(source)
+    if template is None:
+        template = template_cache[source] = environment.from_string(source)
+    return template
+
+
+def wrap(value, value_schema, root, parent, lazy=False, compact=False):
 
     if isinstance(value, JSONBase) or isinstance(value, bool) or \
             value is None:
         # There is no representation of None and booleans as JSONBase objects.
         return value
 
+    if isinstance(value, text_type) and not isinstance(value, str):
+        # Decoders return unicode strings on Python 2.
+        value = value.encode('utf-8')
+
     if isinstance(value, dict):
-        return JSONObject(value, value_schema, root(), parent())
+        return JSONObject(value, value_schema, root(), parent(), lazy,
+                          compact)
     elif isinstance(value, list):
-        return JSONArray(value, value_schema, root(), parent())
+        return JSONArray(value, value_schema, root(), parent(), lazy,
+                         compact)
+    elif compact and isinstance(value, (str, int, float)):
+        # Compact containers keep their scalars as they are.
+        return value
     elif isinstance(value, str):
         return JSONString(value, value_schema, root(), parent())
     elif isinstance(value, int):
@@ -57,16 +113,356 @@ def wrap(value, value_schema, root, parent):
     raise TypeError('Type not defined in JSON Schema.')
 
 
+def _unwrapped(value):
+    """Tell if a value kept by a lazy wrapper still needs to be wrapped."""
+    return not isinstance(value, JSONBase) and \
+        not isinstance(value, bool) and value is not None
+
+
+def _wrap_leaf(container, key, value):
+    """Wrap a scalar stored as is in ``container`` under ``key``."""
+    return wrap(value, container.child_schema(key), container._root,
+                lambda: container)
+
+
+def _validate_child(container, key, value):
+    if isinstance(value, JSONBase):
+        value._validate_external()
+        return
+    schema = container.child_schema(key) or {}
+    if 'validation' in schema or 'enumSource' in schema:
+        value = _wrap_leaf(container, key, value)
+        if isinstance(value, JSONBase):
+            value._validate_external()
+
+
+def _match_key(match):
+    """Return the key under which a JSONPath match was found."""
+    if isinstance(match.path, Index):
+        return match.path.index
+    if isinstance(match.path, Fields):
+        return match.path.fields[0]
+
+
+class JSONValidation(object):
+
+    """Changes to values that are kept only if the values stay valid.
+
+    Changes are made in place and journaled, so they can be undone if the
+    block raises or a value is not valid anymore.  Nothing is copied and
+    only what changed is validated again.
+
+    Transactions can be nested.  An inner transaction that succeeds hands
+    its journal over to the enclosing one, so its changes are still undone
+    if the enclosing transaction fails.
+    """
+
+    def __init__(self, *values):
+        self.values = values
+        self.journal = []
+
+    def __enter__(self):
+        _transactions.append(self)
+        return self.values[0]
+
+    def __exit__(self, type, value, traceback):
+        _transactions.remove(self)
+        if type is not None:
+            self.rollback()
+            return
+        try:
+            for json in self.values:
+                json.validate(incremental=True)
+        except ValidationError:
+            self.rollback()
+            raise
+        for node, undo in self.journal:
+            node._record(undo)
+        del self.journal[:]
+
+    def savepoint(self):
+        """Return a mark of the changes made so far, for ``rollback``."""
+        return len(self.journal)
+
+    def rollback(self, savepoint=0):
+        """Undo the changes made after ``savepoint``, latest first."""
+        while len(self.journal) > savepoint:
+            self.journal.pop()[1]()
+
+
+class JSONBatch(JSONValidation):
+
+    """Changes to several values, validated and kept all together."""
+
+    def __enter__(self):
+        _transactions.append(self)
+        return self
+
+
+def batch(*values):
+    """Return a transaction changing all ``values`` at once.
+
+    The values are validated once, when the block ends, and the changes to
+    all of them are undone if any is invalid.  Nested ``validation`` blocks
+    act as savepoints: they are validated on their own and only their
+    changes are undone if they fail.
+    """
+    return JSONBatch(*values)
+
+
+def _calculated_fields(schema):
+    """Return the names of the fields ``schema`` calculates."""
+    if isinstance(schema, FrozenDict):
+        entry = calculated_cache.get(id(schema))
+        if entry is not None:
+            return entry[1]
+    properties = schema.get('properties')
+    if not isinstance(properties, dict):
+        properties = {}
+    names = frozenset(
+        name for name, item_schema in iteritems(properties) if
+        isinstance(item_schema, dict) and ('getter' in item_schema or (
+            'template' in item_schema and 'watch' in item_schema)))
+    if isinstance(schema, FrozenDict):
+        calculated_cache[id(schema)] = (schema, names)
+    return names
+
+
+def _calculates(schema):
+    """Tell if ``schema`` or any of its subschemas calculates fields."""
+    if isinstance(schema, FrozenDict):
+        entry = calculated_cache.get((id(schema), 'deep'))
+        if entry is not None:
+            return entry[1]
+    found = False
+    seen = set()
+    stack = [schema]
+    while stack and not found:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, dict):
+            found = bool(_calculated_fields(node))
+            stack.extend(itervalues(node))
+        elif isinstance(node, list):
+            stack.extend(node)
+    if isinstance(schema, FrozenDict):
+        calculated_cache[(id(schema), 'deep')] = (schema, found)
+    return found
+
+
+def _json_children(value, schema, include_computed):
+    """Return the (key, child, schema) items of a container and its kind.
+
+    The keys of array items are ``None``.  Stored values are read as they
+    are, with the schemas of their positions, unless calculated fields are
+    needed: then children are read as wrappers.
+    """
+    if isinstance(value, JSONBase):
+        schema = value.schema
+        if include_computed and isinstance(value, JSONArray):
+            return ((None, item, None) for item in value), False
+        if include_computed and isinstance(value, JSONView) and \
+                isinstance(value._data, list):
+            return ((None, value._child(index), None) for
+                    index in range(len(value))), False
+        if include_computed:
+            calculated = _calculated_fields(schema)
+            children = [(key, value._child(key), None) for key in
+                        (value._keys() if isinstance(value, JSONView) else
+                         dict.__iter__(value)) if key not in calculated]
+            children.extend((name, value[name], None) for name in calculated)
+            return children, True
+        if isinstance(value, JSONView):
+            value = value._data
+    schema = schema or {}
+    if isinstance(value, dict):
+        calculated = _calculated_fields(schema)
+        properties = schema.get('properties', {})
+        return ((key, dict.__getitem__(value, key), properties.get(key)) for
+                key in dict.__iter__(value) if key not in calculated), True
+    if isinstance(value, list):
+        items = schema.get('items')
+        if isinstance(items, list):
+            return ((None, item, items[index] if index < len(items) else
+                     None) for index, item in
+                    enumerate(list.__iter__(value))), False
+        return ((None, item, items) for item in list.__iter__(value)), False
+    raise TypeError('%r is not JSON serializable.' % (value, ))
+
+
+def _iterencode(value, include_computed=False):
+    """Yield the compact JSON text of ``value`` in pieces.
+
+    Containers are walked with a stack rather than recursively, so deep
+    documents can be encoded as well.
+    """
+    stack = []
+    schema = None
+    while True:
+        if value is None:
+            yield 'null'
+        elif value is True:
+            yield 'true'
+        elif value is False:
+            yield 'false'
+        elif isinstance(value, string_types):
+            yield encode_basestring_ascii(value)
+        elif isinstance(value, integer_types):
+            yield '%d' % value
+        elif isinstance(value, float):
+            if value != value or value in (float('inf'), float('-inf')):
+                raise ValueError('Out of range float values are not JSON '
+                                 'compliant: %r' % value)
+            yield float.__repr__(value)
+        else:
+            children, is_object = _json_children(value, schema,
+                                                 include_computed)
+            yield '{' if is_object else '['
+            stack.append([iter(children), '}' if is_object else ']', True])
+
+        while stack:
+            entry = stack[-1]
+            try:
+                key, value, schema = next(entry[0])
+            except StopIteration:
+                stack.pop()
+                yield entry[1]
+                continue
+            separator = '' if entry[2] else ','
+            entry[2] = False
+            if key is not None:
+                if not isinstance(key, string_types):
+                    key = text_type(key)
+                separator += encode_basestring_ascii(key) + ':'
+            if separator:
+                yield separator
+            break
+        else:
+            return
+
+
+def dumps(value, include_computed=False, stream=None):
+    """Serialize ``value`` to compact JSON text.
+
+    ``value`` is a wrapper or a plain JSON value.  Calculated fields are
+    left out, or evaluated with ``include_computed``.  With ``stream`` the
+    text is written to it in pieces and nothing is returned.
+    """
+    if stream is None and _fast_dumps is not None and not (
+            isinstance(value, JSONBase) and _calculates(value.schema)):
+        if isinstance(value, JSONView):
+            value = value._data
+        try:
+            return _fast_dumps(value).decode('utf-8')
+        except TypeError:
+            # Numbers too large for it, for instance.
+            pass
+    chunks = _iterencode(value, include_computed)
+    if stream is None:
+        return ''.join(chunks)
+    buffer = []
+    for chunk in chunks:
+        buffer.append(chunk)
+        if len(buffer) == 1024:
+            stream.write(''.join(buffer))
+            del buffer[:]
+    stream.write(''.join(buffer))
+
+
+# Builtin types of the scalars wrappers subclass.
+_SCALAR_TYPES = (str, text_type) + integer_types + (float, )
+
+
+def unwrap(value, include_computed=False):
+    """Return ``value`` as plain dicts, lists, strings and numbers.
+
+    Calculated fields are left out, or evaluated with ``include_computed``.
+    Containers are walked with a stack rather than recursively, so deep
+    documents can be unwrapped as well.
+    """
+    if not isinstance(value, (dict, list, JSONView)):
+        return _unwrap_scalar(value)
+    children, is_object = _json_children(value, None, include_computed)
+    result = {} if is_object else []
+    stack = [(iter(children), result)]
+    while stack:
+        children, container = stack[-1]
+        try:
+            key, value, schema = next(children)
+        except StopIteration:
+            stack.pop()
+            continue
+        if isinstance(value, (dict, list, JSONView)):
+            children, is_object = _json_children(value, schema,
+                                                 include_computed)
+            value = {} if is_object else []
+            stack.append((iter(children), value))
+        else:
+            value = _unwrap_scalar(value)
+        if key is None:
+            container.append(value)
+        else:
+            container[key] = value
+    return result
+
+
+def _unwrap_scalar(value):
+    if value is None or value is True or value is False:
+        return value
+    for type_ in _SCALAR_TYPES:
+        if isinstance(value, type_):
+            return value if type(value) is type_ else type_(value)
+    raise TypeError('%r is not JSON serializable.' % (value, ))
+
+
+def _dependencies(holder, path):
+    """Return the (container, key) pairs the value at ``path`` depends on.
+
+    A key of ``None`` stands for the whole subtree of the container.
+    """
+    dependencies = []
+    current = holder
+    for key in path.split('.'):
+        if not isinstance(current, JSONObject):
+            break
+        dependencies.append((weakref.ref(current), key))
+        try:
+            current = current._child(key)
+        except KeyError:
+            return dependencies
+    if isinstance(current, (JSONObject, JSONArray)):
+        dependencies.append((weakref.ref(current), None))
+    return dependencies
+
+
+def _unchanged(container, key, stamp):
+    if container is None:
+        return False
+    if key is None:
+        return container._touched < stamp
+    return container._stamp(key) < stamp
+
+
 class JSONBase(object):
 
+    # Stamps of the last change of this node and of anything below it.
+    _modified = 0
+    _touched = 0
+    # Stamps of when the node got its schema and was last found valid.
+    _assigned = 0
+    _validated = 0
+
     def __init__(self, schema=None, root=None, parent=None):
         schema = schema or {}
-        if root:
+        if root is not None:
             self.schema = schema
             self._root = weakref.ref(root)
         else:
+            if not isinstance(schema, FrozenDict):
+                schema = compile_schema(schema)
             self.schema = schema
-            self.schema = self._resolve_refs_in_schema(schema)
             try:
                 self._root = weakref.ref(self)
             except TypeError:
@@ -83,10 +479,16 @@ class JSONBase(object):
                 self._parent = lambda: self
 
         self.__doc__ = self.schema.get('description', '')
+        self._assigned = next(_clock)
 
     def search(self, query):
-        jsonpath_expr = parse(query)
-        result = [match.value for match in jsonpath_expr.find(self)]
+        result = []
+        for match in compile_query(query).find(self):
+            value = match.value
+            if _unwrapped(value) and match.context is not None:
+                value = _wrap_leaf(match.context.value, _match_key(match),
+                                   value)
+            result.append(value)
 
         return JSONArray(result, schema={'type': 'array',
                                          'items': [el.schema for
@@ -101,137 +503,308 @@ class JSONBase(object):
         return self._root()
 
     @property
-    def validation(parent):
-
-        class JSONValidation(object):
-            def __init__(self, json):
-                self._json = json
-                self._copy = json.__class__(json, json.schema)
-
-            def __enter__(self):
-                return self._copy
-
-            def __exit__(self, type, value, traceback):
-                if not type:
-                    # There was no exception
-                    self._copy.validate()
-                    self._json._update(self._copy)
-
-        return JSONValidation(parent)
-
-    def validate(self):
-        self._validate_external()
-        types = {
-            'object': (dict, JSONObject,),
-            'array': (list, JSONArray,),
-            'string': (str, JSONString,),
-            'number': (int, float, JSONNumber, JSONInteger),
-            'integer': (int, JSONInteger),
-        }
-        return Draft4Validator(schema=self.schema, types=types).validate(self)
-
-    def _resolve_refs_in_schema(self, schema):
-        if isinstance(schema, dict):
-            if '$ref' in schema:
-                if schema['$ref'].startswith('#'):
-                    return JSONObject._get_from_path(schema['$ref'][2:],
-                                                     self.schema, "/")
-                else:
-                    response = get(schema["$ref"])
+    def validation(self):
+        return JSONValidation(self)
+
+    def to_json(self, include_computed=False, stream=None):
+        """Serialize the value to compact JSON text.
+
+        See :func:`dumps`.
+        """
+        return dumps(self, include_computed, stream)
+
+    def to_python(self, include_computed=False):
+        """Return the value as plain builtins.
+
+        See :func:`unwrap`.
+        """
+        return unwrap(self, include_computed)
+
+    def _record(self, undo):
+        """Give ``undo`` to the innermost transaction holding this value."""
+        if not _transactions:
+            return
+        ancestors = set()
+        node = self
+        while node is not None and id(node) not in ancestors:
+            ancestors.add(id(node))
+            node = node._parent()
+        for transaction in reversed(_transactions):
+            if any(id(value) in ancestors for value in transaction.values):
+                transaction.journal.append((self, undo))
+                return
+
+    def validate(self, incremental=False):
+        """Check the value against its schema and external validators.
+
+        With ``incremental`` only the parts changed since the last
+        successful validation of this value are checked again.
+        """
+        stamp = next(_clock)
+        if incremental and self._validated:
+            self._validate_changes(self._validated)
+        else:
+            self._validate_external()
+            get_validator(self.schema).validate(self)
+        self._validated = stamp
+
+    def _validate_changes(self, since):
+        stack = [(self, ())]
+        while stack:
+            node, path = stack.pop()
+            try:
+                if node._assigned > since:
+                    node._validate_external()
+                    get_validator(node.schema).validate(node)
+                    continue
+                if node._touched <= since:
+                    continue
+                for keyword in EXTERNAL_KEYWORDS:
+                    node._check_external(keyword)
+                get_validator(shallow_schema(node.schema)).validate(node)
+                for key, child in node._stored_items():
+                    if isinstance(child, JSONBase):
+                        stack.append((child, path + (key, )))
+                        continue
+                    # Plain values of compact or lazy containers.
                     try:
-                        response.raise_for_status()
-                        return json.loads(response.content)
-                    except exceptions.RequestException:
-                        return {}
-            if 'items' in schema:
-                items = schema['items']
-                if isinstance(items, list):
-                    schema['items'] = [self._resolve_refs_in_schema(i) for i in
-                                       schema['items']]
-                else:
-                    schema['items'] = \
-                        self._resolve_refs_in_schema(schema['items'])
-            elif 'properties' in schema:
-                schema['properties'] = {k: self._resolve_refs_in_schema(v) for
-                                        (k, v) in
-                                        iteritems(schema['properties'])}
-        return schema
+                        _validate_child(node, key, child)
+                        get_validator(node.child_schema(key) or
+                                      {}).validate(child)
+                    except ValidationError as error:
+                        error.path.appendleft(key)
+                        raise
+            except ValidationError as error:
+                error.path.extendleft(reversed(path))
+                raise
+
+    def _stored_items(self):
+        return ()
 
     def _set_schema(self, schema):
         self.schema = schema
+        self._assigned = next(_clock)
+
+    def _changed(self):
+        stamp = next(_clock)
+        self._modified = stamp
+        node = self
+        while node is not None:
+            node._touched = stamp
+            parent = node._parent()
+            node = None if parent is node else parent
+        return stamp
+
+    def validation_report(self):
+        """Return every error of this value instead of raising the first.
+
+        Schema errors and the errors of external validators are gathered
+        in a single traversal, as ``(pointer, error)`` pairs where
+        ``pointer`` is the JSON pointer of the invalid value.
+        """
+        return [(json_pointer(error.path), error) for error in
+                get_report_validator(self.schema).iter_errors(self)]
 
     def _validate_external(self):
+        for keyword in EXTERNAL_KEYWORDS:
+            self._check_external(keyword)
+
+    def _check_external(self, keyword):
         try:
-            validation_path = self.schema['validation']
-            validation = import_string(validation_path)
-            validation(self)
-        except KeyError:
-            pass
-        try:
-            enum_path = self.schema['enumSource']
-            enum = self._root().schema['properties'][enum_path]
-            if self not in enum:
-                raise ValidationError("%s is not in enum %s" % (self,
-                                                                enum_path))
+            if keyword == 'validation':
+                validation = cached_import_string(self.schema['validation'])
+                validation(self)
+            else:
+                enum_path = self.schema['enumSource']
+                enum = self._root().schema['properties'][enum_path]
+                if self not in get_enum_index(enum):
+                    raise ValidationError("%s is not in enum %s" %
+                                          (self, enum_path))
         except KeyError:
             pass
 
 
 class JSONObject(dict, JSONBase):
 
-    def __new__(cls, mapping=None, schema=None, root=None, parent=None):
+    _lazy = False
+    _compact = False
+
+    def __new__(cls, mapping=None, schema=None, root=None, parent=None,
+                lazy=False, compact=False):
         mapping = mapping or {}
         schema = schema or {}
-        obj = dict.__new__(JSONObject)
+        if lazy and compact:
+            raise ValueError('Wrapping cannot be both lazy and compact.')
+        if lazy:
+            return _LazyJSONObject._create(mapping, schema, root, parent)
+        obj = dict.__new__(_CompactJSONObject if compact else JSONObject)
         JSONBase.__init__(obj, schema, root, parent)
         for name, value in iteritems(mapping):
-            obj[name] = value
+            obj._setitem(name, value)
         return obj
 
-    def __init__(self, mapping=None, schema=None, root=None, parent=None):
+    def __init__(self, mapping=None, schema=None, root=None, parent=None,
+                 lazy=False, compact=False):
         pass
 
+    @classmethod
+    def from_json(cls, data, schema=None, lazy=False, compact=False):
+        """Build an object from a JSON document given as bytes or text."""
+        value = json_loads(data)
+        if not isinstance(value, dict):
+            raise ValueError('The JSON document is not an object.')
+        return JSONObject(value, schema, lazy=lazy, compact=compact)
+
+    # Value stored under a key, without calculated fields.
+    _child = dict.__getitem__
+
     def __getitem__(self, name):
         try:
-            item_getter = self.schema['properties'][name]['getter']
+            item_schema = self.schema['properties'][name]
         except KeyError:
-            try:
-                item_template = self.schema['properties'][name]['template']
-                item_watch = self.schema['properties'][name]['watch']
-            except KeyError:
-                return dict.__getitem__(self, name)
+            return self._child(name)
+        if 'getter' not in item_schema and ('template' not in item_schema or
+                                            'watch' not in item_schema):
+            return self._child(name)
+        if item_schema.get('memoize'):
+            return self._memoized(name, item_schema)
+        return self._calculate(name, item_schema)
 
-            template = Environment().from_string(item_template)
+    def __setitem__(self, name, value):
+        self._journal(name)
+        self._setitem(name, value)
+        self._changed(name)
+
+    def __delitem__(self, name):
+        self._journal(name)
+        dict.__delitem__(self, name)
+        self._changed(name)
+
+    def pop(self, name, *default):
+        changed = name in self
+        if changed:
+            self._journal(name)
+        value = dict.pop(self, name, *default)
+        if changed:
+            self._changed(name)
+        return value
 
-            return template.render({k: self._root()._get_from_path(v, self) for
-                                    (k, v) in iteritems(item_watch)})
+    def popitem(self):
+        for name in self:
+            self._journal(name)
+            break
+        name, value = dict.popitem(self)
+        self._changed(name)
+        return name, value
+
+    def clear(self):
+        names = list(self)
+        self._journal(*names)
+        dict.clear(self)
+        self._changed(*names)
+
+    def _journal(self, *names):
+        """Record how to restore the values under ``names``."""
+        if not _transactions:
+            return
+        saved = [(name, dict.get(self, name, _missing)) for name in names]
+
+        def undo():
+            for name, value in saved:
+                if value is _missing:
+                    dict.pop(self, name, None)
+                else:
+                    dict.__setitem__(self, name, value)
+            self._changed(*names)
+        self._record(undo)
 
-        getter = import_string(item_getter)
-        return getter(self)
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
 
-    def __setitem__(self, name, value):
+    def update(self, *args, **kwargs):
+        for name, value in iteritems(dict(*args, **kwargs)):
+            self[name] = value
+
+    def _setitem(self, name, value):
         try:
             item_setter = self.schema['properties'][name]['setter']
         except KeyError:
-            item_schema = self.schema.get('properties', {}).get(name, None)
-            return dict.__setitem__(self, name, wrap(value, item_schema,
-                                                     self._root, lambda: self))
+            return dict.__setitem__(self, name, wrap(value,
+                                                     self.child_schema(name),
+                                                     self._root, lambda: self,
+                                                     self._lazy,
+                                                     self._compact))
 
-        setter = import_string(item_setter)
+        setter = cached_import_string(item_setter)
         setter(self, name, value)
 
-    def _set_schema(self, schema):
-        self.schema = schema
-        for name, value in iteritems(self):
-            value._set_schema(schema.get('properties', {}).get(name, None))
+    def _calculate(self, name, item_schema):
+        try:
+            getter = cached_import_string(item_schema['getter'])
+        except KeyError:
+            template = get_template(item_schema['template'])
+            return template.render({
+                k: self._root()._get_from_path(v, self) for
+                (k, v) in iteritems(item_schema['watch'])})
+        return getter(self)
+
+    def _memoized(self, name, item_schema):
+        # Calculate again only if something the value depends on changed:
+        # the watched paths of templates, the ``depends_on`` paths of
+        # getters or, without those, the whole object.
+        memo = self.__dict__.setdefault('_memo', {})
+        try:
+            stamp, dependencies, value = memo[name]
+            if all(_unchanged(ref(), key, stamp) for
+                   (ref, key) in dependencies):
+                return value
+        except KeyError:
+            pass
+
+        stamp = next(_clock)
+        value = self._calculate(name, item_schema)
+        if 'getter' in item_schema:
+            paths = item_schema.get('depends_on')
+        else:
+            paths = itervalues(item_schema['watch'])
+        if paths is None:
+            dependencies = [(weakref.ref(self), None)]
+        else:
+            dependencies = [dependency for path in paths for
+                            dependency in _dependencies(self, path)]
+        memo[name] = (stamp, dependencies, value)
+        return value
+
+    def child_schema(self, name):
+        """Return the schema of the value under ``name``."""
+        return self.schema.get('properties', {}).get(name)
 
-    def _update(self, other_dict):
-        dict.__init__(self, other_dict)
+    def _changed(self, *names):
+        stamp = JSONBase._changed(self)
+        stamps = self.__dict__.setdefault('_stamps', {})
+        for name in names:
+            stamps[name] = stamp
+
+    def _stamp(self, name):
+        return self.__dict__.get('_stamps', {}).get(name, 0)
+
+    def _stored_items(self):
+        return dict.items(self)
+
+    def _set_schema(self, schema):
+        JSONBase._set_schema(self, schema)
+        properties = self.schema.get('properties', {})
+        for name in self:
+            value = dict.__getitem__(self, name)
+            if isinstance(value, JSONBase):
+                value._set_schema(properties.get(name, None))
 
     def _validate_external(self):
         JSONBase._validate_external(self)
-        for value in itervalues(self):
-            value._validate_external()
+        for name, value in iteritems(self):
+            _validate_child(self, name, value)
 
     def get(self, value, default=None):
         try:
@@ -241,90 +814,503 @@ class JSONObject(dict, JSONBase):
 
     @classmethod
     def _get_from_path(cls, path, holder, delimiter="."):
-        split_path = path.split(delimiter)
-        current = holder
-        for key in split_path:
-            try:
-                current = current[key]
-            except KeyError:
-                raise KeyError("Path %s is not accessible" % path)
-        return current
+        return get_from_path(path, holder, delimiter)
 
 
 class JSONArray(list, JSONBase):
 
-    def __new__(cls, iterable=None, schema=None, root=None, parent=None):
+    _lazy = False
+    _compact = False
+
+    def __new__(cls, iterable=None, schema=None, root=None, parent=None,
+                lazy=False, compact=False):
         iterable = iterable or []
         schema = schema or {}
-        obj = list.__new__(JSONArray)
+        if lazy and compact:
+            raise ValueError('Wrapping cannot be both lazy and compact.')
+        if lazy:
+            return _LazyJSONArray._create(iterable, schema, root, parent)
+        obj = list.__new__(_CompactJSONArray if compact else JSONArray)
         JSONBase.__init__(obj, schema, root, parent)
-        for value in iterable:
-            obj.append(value)
+        list.extend(obj, [obj._wrap(value, index) for
+                          index, value in enumerate(iterable)])
         return obj
 
-    def __init__(self, iterable=None, schema=None, root=None, parent=None):
+    def __init__(self, iterable=None, schema=None, root=None, parent=None,
+                 lazy=False, compact=False):
         pass
 
+    @classmethod
+    def from_json(cls, data, schema=None, lazy=False, compact=False):
+        """Build an array from a JSON document given as bytes or text."""
+        value = json_loads(data)
+        if not isinstance(value, list):
+            raise ValueError('The JSON document is not an array.')
+        return JSONArray(value, schema, lazy=lazy, compact=compact)
+
     def __setitem__(self, index, value):
-        list.__setitem__(self, index, wrap(value, self._get_schema(index),
-                         self._root, lambda: self))
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                self.splice(start, stop - start, value)
+                return
+            # Extended slices keep the length, so items don't move.
+            self._journal()
+            value = [self._wrap(x, position) for x, position in
+                     zip(value, range(start, stop, step))]
+        else:
+            self._journal_item(index)
+            value = self._wrap(value, index)
+        list.__setitem__(self, index, value)
+        self._changed()
 
     def __setslice__(self, i, j, obj):
-        # O(n)!
-        list.__setslice__(self, i, j, [wrap(x, self._get_schema(i + index),
-                          self._root, lambda: self) for
-                          index, x in enumerate(obj)])
-        self._recompute_schemas(i + len(obj))
+        self.splice(i, j - i, obj)
 
     def append(self, obj):
-        list.append(self, wrap(obj, self._get_schema(max(len(self), 0)),
-                    self._root, lambda: self))
+        self._journal_length()
+        list.append(self, self._wrap(obj, len(self)))
+        self._changed()
 
     def extend(self, obj):
-        list.extend(self, [wrap(x, self._get_schema(index), self._root,
-                           lambda: self) for index, x in enumerate(obj)])
+        self._journal_length()
+        length = len(self)
+        list.extend(self, [self._wrap(x, length + index) for
+                           index, x in enumerate(obj)])
+        self._changed()
 
     def insert(self, index, obj):
-        # O(n)!
         index = max(min(len(self), index), -len(self))
         if index < 0:
             index = len(self) + index
-        list.insert(self, index, wrap(obj, self._get_schema(index), self._root,
-                                      lambda: self))
-        self._recompute_schemas(index)
+        self.splice(index, 0, [obj])
+
+    def splice(self, start, delete_count=None, items=()):
+        """Replace ``delete_count`` items from ``start`` on with ``items``.
+
+        All the items from ``start`` on are removed if ``delete_count`` is
+        ``None``.  Returns the removed items.
+        """
+        length = len(self)
+        if start < 0:
+            start = max(length + start, 0)
+        start = min(start, length)
+        if delete_count is None:
+            delete_count = length - start
+        delete_count = max(min(delete_count, length - start), 0)
+        self._journal()
+        stop = start + delete_count
+        removed = list.__getitem__(self, slice(start, stop))
+        items = [self._wrap(x, start + index) for
+                 index, x in enumerate(items)]
+        list.__setitem__(self, slice(start, stop), items)
+        self._recompute_schemas(start + len(items),
+                                len(items) - delete_count)
+        self._changed()
+        return removed
+
+    def __iadd__(self, obj):
+        self.extend(obj)
+        return self
+
+    def __imul__(self, times):
+        self._journal()
+        length = len(self)
+        list.__imul__(self, times)
+        self._recompute_schemas(length, len(self) - length)
+        self._changed()
+        return self
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            self.splice(self._position(index), 1)
+            return
+        start, stop, step = index.indices(len(self))
+        if step == 1:
+            self.splice(start, stop - start)
+            return
+        self._journal()
+        list.__delitem__(self, index)
+        self._recompute_schemas(0)
+        self._changed()
+
+    def __delslice__(self, i, j):
+        self.splice(i, j - i)
+
+    def pop(self, index=-1):
+        if not self:
+            raise IndexError('pop from empty list')
+        index = self._position(index)
+        value = list.__getitem__(self, index)
+        self.splice(index, 1)
+        return value
+
+    def remove(self, value):
+        self.splice(self.index(value), 1)
+
+    def reverse(self):
+        self._journal()
+        list.reverse(self)
+        self._recompute_schemas(0)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        self._journal()
+        list.sort(self, *args, **kwargs)
+        self._recompute_schemas(0)
+        self._changed()
+
+    def _position(self, index):
+        """Return the non-negative position of ``index``."""
+        position = len(self) + index if index < 0 else index
+        if not 0 <= position < len(self):
+            raise IndexError('list index out of range')
+        return position
+
+    def _journal(self):
+        """Record how to restore all the items."""
+        if not _transactions:
+            return
+        saved = list(list.__iter__(self))
+
+        def undo():
+            list.__setitem__(self, slice(None), saved)
+            self._recompute_schemas(0)
+            self._changed()
+        self._record(undo)
+
+    def _journal_item(self, index):
+        """Record how to restore the item at ``index``."""
+        if not _transactions:
+            return
+        saved = list.__getitem__(self, index)
+
+        def undo():
+            list.__setitem__(self, index, saved)
+            self._changed()
+        self._record(undo)
+
+    def _journal_length(self):
+        """Record how to drop the items about to be added."""
+        if not _transactions:
+            return
+        length = len(self)
+
+        def undo():
+            list.__delitem__(self, slice(length, None))
+            self._changed()
+        self._record(undo)
+
+    def _wrap(self, value, index):
+        return wrap(value, self._get_schema(index), self._root, lambda: self,
+                    self._lazy, self._compact)
+
+    def _stamp(self, index):
+        # Indexes move around, so any change counts.
+        return self._modified
 
     def _get_schema(self, index):
         subschema = self.schema.get('items', None)
         if isinstance(subschema, dict):
             return subschema
         elif isinstance(subschema, list):
-            index = len(subschema) + index if index < 0 else index
+            index = len(self) + index if index < 0 else index
             if len(subschema) > index:
                 return subschema[index]
             else:
                 return None
 
-    def _recompute_schemas(self, index):
-        # Recompute the schema starting from the element next to the one
-        # indicated by index.
+    def child_schema(self, index):
+        """Return the schema of the item at ``index``."""
+        return self._get_schema(index)
+
+    def _recompute_schemas(self, index, shift=None):
+        # Give the items from index on the schemas of their new positions,
+        # after shift items were added before them, or removed if it is
+        # negative.  Without shift the items may come from anywhere.
+        items = self.schema.get('items', None)
+        if not isinstance(items, list):
+            # The schema of an item does not depend on its position.
+            return
         length = len(self)
         index = length + index if index < 0 else index
+        if shift is not None:
+            # Items past the tuple only change if they used to be in it.
+            length = min(length, len(items) + max(shift, 0))
         while index < length:
-            self[index]._set_schema(self._get_schema(index))
+            value = list.__getitem__(self, index)
+            schema = self._get_schema(index) or {}
+            if isinstance(value, JSONBase) and value.schema is not schema \
+                    and (value.schema or schema):
+                value._set_schema(schema)
             index = index + 1
 
+    def _stored_items(self):
+        return enumerate(list.__iter__(self))
+
     def _set_schema(self, schema):
-        self.schema = schema
-        for index, value in enumerate(self):
-            value._set_schema(self._get_schema(index))
+        JSONBase._set_schema(self, schema)
+        for index in range(len(self)):
+            value = list.__getitem__(self, index)
+            if isinstance(value, JSONBase):
+                value._set_schema(self._get_schema(index))
+
+    def _validate_external(self):
+        JSONBase._validate_external(self)
+        for index, item in enumerate(self):
+            _validate_child(self, index, item)
+
+
+class _LazyJSONObject(JSONObject):
+
+    """Object wrapping its values only when they are first read."""
+
+    _lazy = True
+
+    @classmethod
+    def _create(cls, mapping, schema, root, parent):
+        obj = dict.__new__(cls)
+        JSONBase.__init__(obj, schema, root, parent)
+        dict.update(obj, mapping)
+        # Setters still see every value.
+        for name, item_schema in iteritems(obj.schema.get('properties', {})):
+            if name in mapping and 'setter' in item_schema:
+                dict.__delitem__(obj, name)
+                obj._setitem(name, mapping[name])
+        return obj
+
+    def _child(self, name):
+        value = dict.__getitem__(self, name)
+        if _unwrapped(value):
+            value = wrap(value, self.schema.get('properties', {}).get(name),
+                         self._root, lambda: self, True)
+            dict.__setitem__(self, name, value)
+        return value
+
+    def itervalues(self):
+        for name in self:
+            yield self._child(name)
+
+    def iteritems(self):
+        for name in self:
+            yield name, self._child(name)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+
+class _LazyJSONArray(JSONArray):
+
+    """Array wrapping its items only when they are first read."""
+
+    _lazy = True
+
+    @classmethod
+    def _create(cls, iterable, schema, root, parent):
+        obj = list.__new__(cls)
+        JSONBase.__init__(obj, schema, root, parent)
+        list.extend(obj, iterable)
+        return obj
+
+    def _child(self, index):
+        value = list.__getitem__(self, index)
+        if _unwrapped(value):
+            value = self._wrap(value, index)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._child(i) for i in range(*index.indices(len(self)))]
+        return self._child(index)
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(max(0, i), max(0, j)))
 
-    def _update(self, copy):
-        self[:] = copy
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._child(index)
+
+
+class _CompactJSONObject(JSONObject):
+
+    """Object keeping its scalar values as plain Python values.
+
+    The schema of a scalar is given by :meth:`child_schema` and its parent
+    is the object itself.
+    """
+
+    _compact = True
+
+
+class _CompactJSONArray(JSONArray):
+
+    """Array keeping its scalar items as plain Python values."""
+
+    _compact = True
+
+
+class JSONView(JSONBase):
+
+    """Read-only wrapper over a plain ``dict`` or ``list``.
+
+    The data is used by reference: nothing is copied and the schema of a
+    value is looked up only when the value is read.  Containers are read as
+    views, cached on their parent, and scalars as short-lived wrappers.  The
+    data must not be changed behind the view's back.
+    """
+
+    def __init__(self, data, schema=None, root=None, parent=None):
+        self._data = data
+        self._views = {}
+        JSONBase.__init__(self, schema, root, parent)
+
+    # Calculated fields work as in objects.
+    __getitem__ = get_unbound_function(JSONObject.__getitem__)
+    _calculate = get_unbound_function(JSONObject._calculate)
+    _memoized = get_unbound_function(JSONObject._memoized)
+    _get_schema = get_unbound_function(JSONArray._get_schema)
+
+    def _child(self, key):
+        value = self._data[key]
+        if not isinstance(value, (dict, list)):
+            return _wrap_leaf(self, key, value)
+        if isinstance(key, int) and key < 0:
+            key += len(self._data)
+        try:
+            return self._views[key]
+        except KeyError:
+            view = self._views[key] = JSONView(value, self.child_schema(key),
+                                               self._root(), self)
+            return view
+
+    def child_schema(self, key):
+        """Return the schema of the value under ``key``."""
+        if isinstance(self._data, dict):
+            return self.schema.get('properties', {}).get(key)
+        return self._get_schema(key)
+
+    def _keys(self):
+        if isinstance(self._data, dict):
+            return iter(self._data)
+        return iter(range(len(self._data)))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        if isinstance(self._data, dict):
+            return iter(self._data)
+        return (self._child(index) for index in self._keys())
+
+    def __contains__(self, value):
+        return value in self._data
+
+    def __eq__(self, other):
+        if isinstance(other, JSONView):
+            other = other._data
+        return self._data == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'JSONView(%r)' % (self._data, )
+
+    def keys(self):
+        return list(self._data)
+
+    def values(self):
+        return [self._child(key) for key in self._keys()]
+
+    def items(self):
+        return [(key, self._child(key)) for key in self._keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def search(self, query):
+        result = []
+        for match in compile_query(query).find(self._data):
+            keys = []
+            while match.context is not None:
+                key = _match_key(match)
+                if key is not None:
+                    keys.append(key)
+                match = match.context
+            value = self
+            for key in reversed(keys):
+                value = value._child(key)
+            result.append(value)
+
+        return JSONArray(result, schema={'type': 'array',
+                                         'items': [el.schema for
+                                                   el in result]})
+
+    @property
+    def validation(self):
+        raise TypeError('JSONView is read-only.')
+
+    def validate(self, incremental=False):
+        # Views can't be changed, so what was valid still is.
+        if incremental and self._validated:
+            return
+        stamp = next(_clock)
+        self._validate_external()
+        get_validator(self.schema).validate(self._data)
+        self._validated = stamp
+
+    def validation_report(self):
+        report = [(json_pointer(error.path), error) for error in
+                  get_validator(self.schema).iter_errors(self._data)]
+        report.extend(self._external_report(()))
+        return report
+
+    def _external_report(self, path):
+        # Walk the data once, checking the values the schema accepts.
+        stack = [(self, self._data, path)]
+        while stack:
+            node, value, path = stack.pop()
+            if not has_type(value, node.schema or {}):
+                continue
+            for keyword in EXTERNAL_KEYWORDS:
+                try:
+                    node._check_external(keyword)
+                except ValidationError as error:
+                    yield json_pointer(path), error
+            if not isinstance(node, JSONView):
+                continue
+            for key in reversed(list(node._keys())):
+                value = node._data[key]
+                if isinstance(value, (dict, list)):
+                    child = JSONView(value, node.child_schema(key),
+                                     self._root(), node)
+                else:
+                    child = _wrap_leaf(node, key, value)
+                if isinstance(child, JSONBase):
+                    stack.append((child, value, path + (key, )))
 
     def _validate_external(self):
         JSONBase._validate_external(self)
-        for item in self:
-            item._validate_external()
+        for key in self._keys():
+            value = self._data[key]
+            if isinstance(value, (dict, list)):
+                # Not kept: validating must not leave the whole tree behind.
+                value = JSONView(value, self.child_schema(key), self._root(),
+                                 self)
+            _validate_child(self, key, value)
+
+    @classmethod
+    def _get_from_path(cls, path, holder, delimiter="."):
+        return get_from_path(path, holder, delimiter)
 
 
 class JSONString(str, JSONBase):
@@ -338,7 +1324,8 @@ class JSONString(str, JSONBase):
     def __init__(self, iterable=None, schema=None, root=None, parent=None):
         pass
 
-    def _update(self, other_string):
+    @property
+    def validation(self):
         raise RuntimeError('JSONString is immutable.')
 
 
@@ -353,7 +1340,8 @@ class JSONNumber(float, JSONBase):
     def __init__(self, number=None, schema=None, root=None, parent=None):
         pass
 
-    def _update(self, other_number):
+    @property
+    def validation(self):
         raise RuntimeError('JSONNumber is immutable.')
 
 
@@ -368,5 +1356,6 @@ class JSONInteger(int, JSONBase):
     def __init__(self, number=None, schema=None, root=None, parent=None):
         pass
 
-    def _update(self, other_integer):
+    @property
+    def validation(self):
         raise RuntimeError('JSONInteger is immutable.')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test queries."""
+
+from __future__ import absolute_import
+
+import pickle
+
+from jsonalchemy.query import compile_query
+from jsonalchemy.query import query_cache
+from jsonalchemy.query import search_many
+from jsonalchemy.wrappers import JSONArray
+from jsonalchemy.wrappers import JSONObject
+
+
+def test_compile_query():
+    """Queries are parsed once and can be applied to many records."""
+    query = compile_query('authors[*].family_name')
+
+    assert compile_query('authors[*].family_name') is query
+    assert compile_query(query) is query
+    assert query.values({'authors': [{'family_name': 'Higgs'}]}) == \
+        ['Higgs']
+    assert pickle.loads(pickle.dumps(query)) is query
+
+
+def test_search_uses_compiled_query():
+    """Searching records reuses the parsed query."""
+    query_cache.clear()
+    hits = query_cache.hits
+    records = [JSONObject({'authors': [{'family_name': name}]}) for
+               name in ('Higgs', 'Englert')]
+
+    results = [record.search('authors[0].family_name') for
+               record in records]
+
+    assert query_cache.hits == hits + 1
+    assert isinstance(results[0], JSONArray)
+    assert results == [['Higgs'], ['Englert']]
+
+
+def test_search_many():
+    """Matches of many records are streamed with their position."""
+    records = [
+        {'authors': [{'family_name': 'Higgs'}, {'family_name': 'Kibble'}]},
+        JSONObject({'authors': []}),
+        JSONObject({'authors': [{'family_name': 'Englert'}]}),
+    ]
+
+    matches = search_many(records, 'authors[*].family_name')
+
+    assert next(matches) == (0, 'authors.[0].family_name', 'Higgs')
+    assert list(matches) == [(0, 'authors.[1].family_name', 'Kibble'),
+                             (2, 'authors.[0].family_name', 'Englert')]
+
+
+def test_search_many_processes():
+    """Records can be searched by a pool of processes."""
+    records = [{'id': index} for index in range(25)]
+
+    matches = list(search_many(records, 'id', processes=2, chunksize=4))
+
+    assert matches == [(index, 'id', index) for index in range(25)]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test bulk processing of records."""
+
+from __future__ import absolute_import
+
+import io
+
+import pytest
+
+from jsonalchemy.records import iter_records
+from jsonalchemy.records import validate_many
+from jsonalchemy.utils import load_schema_from_url
+from jsonalchemy.wrappers import JSONObject
+from jsonalchemy.wrappers import JSONString
+
+from jsonschema import ValidationError
+
+from helpers import abs_path
+
+RECORDS = [
+    {'authors': [{'family_name': 'Higgs'}]},
+    {'authors': [{'family_name': 'Englert', 'given_name': 'Francois'}]},
+    {'authors': []},
+]
+
+JSONL = b'{"authors": [{"family_name": "Higgs"}]}\n' \
+    b'{"authors": [{"family_name": "Englert", "given_name": "Francois"}]}\n' \
+    b'\n' \
+    b'{"authors": []}\n'
+
+ARRAY = b' [{"authors": [{"family_name": "Higgs"}]},\n' \
+    b' {"authors": [{"family_name": "Englert", "given_name": "Francois"}]},' \
+    b'{"authors": []} ] '
+
+
+def test_iter_records_jsonl():
+    """JSON Lines files yield one wrapped record per line."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+
+    records = list(iter_records(io.BytesIO(JSONL), schema, validate=True))
+
+    assert records == RECORDS
+    assert isinstance(records[0], JSONObject)
+    assert isinstance(records[0]['authors'][0]['family_name'], JSONString)
+    assert records[0].schema is records[1].schema
+
+
+@pytest.mark.parametrize('bufsize', [1, 7, 65536])
+def test_iter_records_array(bufsize):
+    """Top-level arrays are read incrementally."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+
+    records = iter_records(io.BytesIO(ARRAY), schema, format='array',
+                           bufsize=bufsize)
+
+    assert list(records) == RECORDS
+    numbers = iter_records(io.BytesIO(b'[1234, 5.5,-6 ]'), format='array',
+                           bufsize=2)
+    assert list(numbers) == [1234, 5.5, -6]
+    for size in range(1, 12):
+        numbers = iter_records(io.BytesIO(b'[1.5, 2e3,-6E-1]'),
+                               format='array', bufsize=size)
+        assert list(numbers) == [1.5, 2000.0, -0.6]
+    assert list(iter_records(io.BytesIO(b'[ ]'), format='array')) == []
+
+
+def test_iter_records_errors():
+    """Invalid records and documents raise while iterating."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    invalid = b'{"authors": [{"given_name": "francois"}]}\n'
+
+    with pytest.raises(ValidationError):
+        list(iter_records(io.BytesIO(invalid), schema, validate=True))
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b'[{}, {}'), format='array'))
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b'{}'), format='array'))
+    with pytest.raises(ValueError) as excinfo:
+        list(iter_records(io.BytesIO(b'[1, 2 3]'), format='array',
+                          bufsize=4))
+    assert 'position 6' in str(excinfo.value)
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b''), format='csv'))
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_validate_many(workers):
+    """Records are validated in order, in processes or not."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    invalid = [{'authors': [{'given_name': 'francois'}]},
+               {'authors': [{'family_name': 1}]}]
+    records = (RECORDS + invalid) * 5
+
+    results = list(validate_many(iter(records), schema, workers=workers,
+                                 chunksize=3))
+
+    assert len(results) == len(records)
+    for record, error in zip(records, results):
+        if record in invalid:
+            assert isinstance(error, ValidationError)
+        else:
+            assert error is None
+    assert 'start with an uppercase' in str(results[3])
+    assert 'is not of type' in str(results[4])
+    assert list(results[4].path) == ['authors', 0, 'family_name']
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test compiled schemas."""
+
+from __future__ import absolute_import
+
+import copy
+import httpretty
+import pickle
+
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from jsonalchemy.schema import CompiledSchema
+from jsonalchemy.schema import RefResolver
+from jsonalchemy.schema import compile_schema
+from jsonalchemy.utils import load_schema_from_url
+from jsonalchemy.wrappers import JSONArray
+from jsonalchemy.wrappers import JSONObject
+
+from jsonschema import RefResolutionError
+
+from helpers import abs_path
+
+
+def test_compile_resolves_refs():
+    """Local references are resolved without touching the given schema."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    original = copy.deepcopy(schema)
+
+    compiled = compile_schema(schema)
+
+    assert isinstance(compiled, CompiledSchema)
+    assert schema == original
+    family_name = compiled['properties']['authors']['items'][
+        'properties']['family_name']
+    assert family_name is compiled['definitions']['family_name_definitions']
+    assert compile_schema(compiled) is compiled
+
+
+def test_compiled_schema_is_immutable():
+    """Compiled schemas reject any modification."""
+    compiled = compile_schema({'type': 'array',
+                               'items': [{'type': 'string'}]})
+
+    with pytest.raises(TypeError):
+        compiled['type'] = 'object'
+    with pytest.raises(TypeError):
+        compiled['items'].append({})
+    with pytest.raises(TypeError):
+        del compiled['items'][0]['type']
+
+
+def test_compiled_schema_is_shared():
+    """Wrappers use the compiled schema as is."""
+    compiled = compile_schema(
+        load_schema_from_url(abs_path('schemas/complex.json')))
+
+    first = JSONObject({'authors': [{'family_name': 'Ellis'}]}, compiled)
+    second = JSONObject({'authors': [{'family_name': 'Higgs'}]}, compiled)
+
+    assert first.schema is compiled
+    assert second['authors'].schema is first['authors'].schema
+    assert isinstance(JSONArray([], compiled['properties']['authors']).schema,
+                      dict)
+
+
+def test_recursive_ref():
+    """Recursive references point back to the same node."""
+    compiled = compile_schema({
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'children': {'type': 'array',
+                         'items': {'$ref': '#/definitions/node'}},
+        },
+        'definitions': {
+            'node': {
+                'type': 'object',
+                'properties': {'next': {'$ref': '#/definitions/node'}},
+            },
+        },
+    })
+
+    node = compiled['definitions']['node']
+    assert node['properties']['next'] is node
+
+    data = JSONObject({'children': [{'next': {'next': {}}}]}, compiled)
+    data.validate()
+    assert data['children'][0]['next'].schema is node
+
+
+def test_pointer_refs():
+    """Whole-document and escaped references are resolved."""
+    compiled = compile_schema({
+        'type': 'object',
+        'properties': {
+            'self': {'$ref': '#'},
+            'slash': {'$ref': '#/definitions/a~1b'},
+            'tilde': {'$ref': '#/definitions/c~0d'},
+            'first': {'$ref': '#/definitions/list/0'},
+        },
+        'definitions': {
+            'a/b': {'type': 'string'},
+            'c~d': {'type': 'number'},
+            'list': [{'type': 'integer'}],
+        },
+    })
+
+    assert compiled['properties']['self'] == compiled
+    assert compiled['properties']['slash'] == {'type': 'string'}
+    assert compiled['properties']['tilde'] == {'type': 'number'}
+    assert compiled['properties']['first'] == {'type': 'integer'}
+    JSONObject({'self': {'self': {'slash': 'a'}}}, compiled).validate()
+
+
+def test_circular_remote_refs():
+    """Reference cycles through several documents are detected."""
+    resolver = RefResolver()
+    resolver.cache['http://www.json.com/a'] = {
+        '$ref': 'http://www.json.com/b'}
+    resolver.cache['http://www.json.com/b'] = {
+        '$ref': 'http://www.json.com/a'}
+
+    with pytest.raises(RefResolutionError) as excinfo:
+        compile_schema({'$ref': 'http://www.json.com/a'}, resolver)
+    assert 'Circular reference' in str(excinfo.value)
+
+
+def test_copy_compiled_schema():
+    """Copies of compiled schemas share the frozen nodes."""
+    compiled = compile_schema(
+        load_schema_from_url(abs_path('schemas/complex.json')))
+
+    assert copy.deepcopy(compiled) is compiled
+    assert copy.copy(compiled['properties']) is compiled['properties']
+    assert copy.deepcopy({'schema': compiled})['schema'] is compiled
+
+
+def test_pickle_compiled_schema():
+    """Compiled schemas survive pickling."""
+    compiled = compile_schema(
+        load_schema_from_url(abs_path('schemas/items_in_list.json')))
+
+    loaded = pickle.loads(pickle.dumps(compiled, pickle.HIGHEST_PROTOCOL))
+
+    assert loaded == compiled
+    with pytest.raises(TypeError):
+        loaded['items'].append({})
+
+
+def test_resolver_disk_cache(tmpdir):
+    """Remote documents are cached on disk and revalidated by ETag."""
+    httpretty.enable()
+    try:
+        httpretty.register_uri(httpretty.GET, "http://www.json.com/",
+                               body='{"type": "string"}',
+                               content_type="application/json",
+                               adding_headers={'ETag': '"v1"'})
+        schema = load_schema_from_url(abs_path('schemas/external.json'))
+
+        compiled = compile_schema(schema,
+                                  RefResolver(cache_dir=str(tmpdir)))
+        family_name = compiled['properties']['authors']['items'][
+            'properties']['family_name']
+        assert family_name == {'type': 'string'}
+
+        httpretty.register_uri(httpretty.GET, "http://www.json.com/",
+                               status=304)
+        resolver = RefResolver(cache_dir=str(tmpdir))
+        assert resolver.resolve("http://www.json.com") == {'type': 'string'}
+        assert httpretty.last_request().headers['If-None-Match'] == '"v1"'
+
+        resolver.resolve("http://www.json.com")
+        assert resolver.cache.hits == 1
+
+        httpretty.register_uri(httpretty.GET, "http://www.json.com/",
+                               status=500)
+        stale = RefResolver(cache_dir=str(tmpdir))
+        assert stale.resolve("http://www.json.com") == {'type': 'string'}
+    finally:
+        httpretty.disable()
+        httpretty.reset()
+
+
+@httpretty.activate
+def test_resolver_fetch_failure():
+    """Documents that can't be fetched nor found in a cache raise."""
+    httpretty.register_uri(httpretty.GET, "http://www.no.com/",
+                           status=500)
+
+    with pytest.raises(RefResolutionError):
+        RefResolver().resolve("http://www.no.com")
+    with pytest.raises(RefResolutionError):
+        compile_schema({'$ref': 'http://www.no.com'}, RefResolver())
+
+
+def test_resolver_store_concurrently(tmpdir):
+    """Documents can be stored by many threads into a new directory."""
+    resolver = RefResolver(cache_dir=str(tmpdir.join('cache')))
+    urls = ['http://www.json.com/%d' % index for index in range(16)]
+
+    pool = ThreadPool(8)
+    try:
+        pool.map(lambda url: resolver._store(url, None, {}), urls)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert all(resolver._load(url)['document'] == {} for url in urls)
+
+
+def test_resolver_offline(tmpdir):
+    """Offline resolvers only serve cached documents."""
+    RefResolver(cache_dir=str(tmpdir))._store(
+        "http://www.json.com", None, {'type': 'string'})
+    resolver = RefResolver(cache_dir=str(tmpdir), offline=True)
+
+    assert resolver.resolve("http://www.json.com") == {'type': 'string'}
+    with pytest.raises(RefResolutionError):
+        resolver.resolve("http://www.no.com")
+
+
+@httpretty.activate
+def test_resolver_prefetch():
+    """Remote references are fetched up front, transitively."""
+    httpretty.register_uri(httpretty.GET, "http://www.json.com/name",
+                           body='{"$ref": "http://www.json.com/string"}',
+                           content_type="application/json")
+    httpretty.register_uri(httpretty.GET, "http://www.json.com/string",
+                           body='{"type": "string"}',
+                           content_type="application/json")
+    httpretty.register_uri(httpretty.GET, "http://www.json.com/number",
+                           body='{"type": "number"}',
+                           content_type="application/json")
+    schema = {
+        'type': 'object',
+        'properties': {
+            'name': {'$ref': 'http://www.json.com/name'},
+            'age': {'$ref': 'http://www.json.com/number'},
+        },
+    }
+    resolver = RefResolver()
+
+    resolver.prefetch(schema)
+
+    assert len(resolver.cache) == 3
+    misses = resolver.cache.misses
+    compiled = compile_schema(schema, resolver)
+    assert compiled['properties']['name'] == {'type': 'string'}
+    assert compiled['properties']['age'] == {'type': 'number'}
+    assert resolver.cache.misses == misses
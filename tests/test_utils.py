@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test utils."""
+
+from __future__ import absolute_import
+
+from jsonalchemy.fortests import helpers
+from jsonalchemy.utils import LRUCache
+from jsonalchemy.utils import cached_import_string
+from jsonalchemy.utils import clear_import_cache
+from jsonalchemy.utils import json_pointer
+
+
+def test_lru_cache():
+    """The least recently used entries are evicted first."""
+    cache = LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+
+    assert cache.get('a') == 1
+    cache['c'] = 3
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_import_cache(monkeypatch):
+    """Hooks are imported once until the cache is cleared."""
+    path = 'jsonalchemy.fortests.helpers.author'
+    clear_import_cache()
+
+    assert cached_import_string(path) is helpers.author
+
+    monkeypatch.setattr(helpers, 'author', lambda field: 'Reloaded')
+    assert cached_import_string(path) is not helpers.author
+
+    clear_import_cache()
+    assert cached_import_string(path)(None) == 'Reloaded'
+    clear_import_cache()
+
+
+def test_json_pointer():
+    """Paths are turned into escaped JSON pointers."""
+    assert json_pointer([]) == ''
+    assert json_pointer(['authors', 0, 'a/b~c']) == '/authors/0/a~1b~0c'
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of JSONAlchemy.
+# Copyright (C) 2015 CERN.
+#
+# JSONAlchemy is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# JSONAlchemy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with JSONAlchemy; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test validators."""
+
+from __future__ import absolute_import
+
+import pytest
+
+from jsonalchemy.schema import compile_schema
+from jsonalchemy.utils import load_schema_from_url
+from jsonalchemy.validators import CompiledValidator
+from jsonalchemy.validators import TYPES
+from jsonalchemy.validators import enable_compiled_validators
+from jsonalchemy.validators import get_enum_index
+from jsonalchemy.validators import get_validator
+from jsonalchemy.validators import validator_cache
+from jsonalchemy.wrappers import JSONObject
+
+from jsonschema import Draft4Validator
+from jsonschema import ValidationError
+from jsonschema.exceptions import UnknownType
+
+from helpers import abs_path
+
+
+def test_validator_cache():
+    """Records sharing a compiled schema share its validator."""
+    schema = compile_schema(
+        load_schema_from_url(abs_path('schemas/complex.json')))
+    validator_cache.clear()
+    hits, misses = validator_cache.hits, validator_cache.misses
+
+    for name in ('Ellis', 'Higgs', 'Englert'):
+        JSONObject({'authors': [{'family_name': name}]}, schema).validate()
+
+    assert validator_cache.misses == misses + 1
+    assert validator_cache.hits == hits + 2
+    assert get_validator(schema) is get_validator(schema)
+
+
+def test_validator_cache_skips_plain_schemas():
+    """Plain schemas may change, so their validators are not cached."""
+    schema = {'type': 'string'}
+
+    assert get_validator(schema) is not get_validator(schema)
+
+
+@pytest.fixture
+def compiled_validators(request):
+    enable_compiled_validators()
+    request.addfinalizer(lambda: enable_compiled_validators(False))
+
+
+@pytest.mark.parametrize('filename, value', [
+    ('complex.json', {'authors': [{'family_name': 'Ellis'}]}),
+    ('complex.json', {'authors': [{'family_name': 'E'}]}),
+    ('complex.json', {'authors': [{'affiliation': 7}]}),
+    ('items_in_list.json', [1600, 'Pennsylvania', 'Avenue', 'NW']),
+    ('items_in_list.json', [1600, 'Pennsylvania', 'Road', 'NW']),
+    ('items_in_list.json', [True, 'Pennsylvania']),
+    ('multiple_types.json', {'idontknowthetype': [[]]}),
+    ('multiple_types.json', {'idontknowthetype': [['str'], {}]}),
+    ('multiple_types.json', {'idontknowthetype': [{'foo': 1}]}),
+    ('required_field.json', {'my_field': 'test'}),
+])
+def test_compiled_validator_errors(compiled_validators, filename, value):
+    """Generated validators raise the same errors as Draft4Validator."""
+    schema = compile_schema(load_schema_from_url(
+        abs_path('schemas/' + filename)))
+    validator = get_validator(schema)
+    reference = Draft4Validator(schema, types=TYPES)
+
+    assert isinstance(validator, CompiledValidator)
+    assert validator.is_valid(value) == reference.is_valid(value)
+    assert [e.message for e in validator.iter_errors(value)] == \
+        [e.message for e in reference.iter_errors(value)]
+
+
+def test_compiled_validator_fallback(compiled_validators):
+    """Keywords without generated code are checked by Draft4Validator."""
+    schema = compile_schema({
+        'type': 'object',
+        'properties': {
+            'tags': {'type': 'array', 'uniqueItems': True},
+            'kind': {'type': 'unknown'},
+        },
+    })
+    data = JSONObject({'tags': ['a', 'b']}, schema)
+
+    data.validate()
+    data['tags'].append('a')
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate()
+    assert 'non-unique' in str(excinfo.value)
+
+    data['kind'] = 'a'
+    with pytest.raises(UnknownType):
+        get_validator(schema).is_valid({'kind': 'a'})
+
+
+def test_enum_index():
+    """Enum sources are matched through a cached, type-aware index."""
+    enum = compile_schema({'enum': [1, 'a', u'\xe9', None, {'b': 2}]})['enum']
+    index = get_enum_index(enum)
+
+    assert get_enum_index(enum) is index
+    assert 1 in index and 1.0 in index
+    assert True not in index and 2 not in index
+    assert 'a' in index and u'\xe9'.encode('utf-8') in index
+    assert None in index and {'b': 2} in index and [] not in index
+
+    root = compile_schema({
+        'properties': {
+            'codes': [True, 2.0, 'x'],
+            'code': {'enumSource': 'codes'},
+        },
+    })
+    JSONObject({'code': 2}, root).validate()
+    JSONObject({'code': 'x'}, root).validate()
+    with pytest.raises(ValidationError) as excinfo:
+        JSONObject({'code': 1}, root).validate()
+    assert 'is not in enum codes' in str(excinfo.value)
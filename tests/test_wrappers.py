@@ -22,17 +22,27 @@
 from __future__ import absolute_import
 
 import httpretty
+import io
 import json
 import pytest
 
+from jsonalchemy.fortests import helpers
 from jsonalchemy.fortests.helpers import author
+from jsonalchemy.schema import compile_schema
+from jsonalchemy.utils import clear_import_cache
 from jsonalchemy.utils import load_schema_from_url
 from jsonalchemy.wrappers import JSONArray
 from jsonalchemy.wrappers import JSONInteger
 from jsonalchemy.wrappers import JSONNumber
 from jsonalchemy.wrappers import JSONObject
 from jsonalchemy.wrappers import JSONString
+from jsonalchemy.wrappers import JSONView
+from jsonalchemy.wrappers import batch
+from jsonalchemy.wrappers import dumps
+from jsonalchemy.wrappers import get_template
+from jsonalchemy.wrappers import unwrap
 
+from jsonschema import RefResolutionError
 from jsonschema import SchemaError
 from jsonschema import ValidationError
 from jsonschema.exceptions import UnknownType
@@ -282,6 +292,94 @@ def test_with_statement_array():
     assert data[0] == 'list1'
 
 
+def test_with_statement_in_place():
+    """With blocks change the value itself and undo failed changes."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    data = JSONObject({
+        'authors': [{'family_name': 'Ellis'}, {'family_name': 'Higgs'}]
+    }, schema=schema)
+    authors = data['authors']
+
+    with data.validation as d:
+        assert d is data
+        d['authors'].append({'family_name': 'Cranmer'})
+    assert data['authors'] is authors
+    assert len(authors) == 3
+
+    with pytest.raises(ValidationError):
+        with data.validation as d:
+            d['authors'].reverse()
+            d['authors'].pop(0)
+            d['authors'].append({'given_name': 'francois'})
+            d['authors'][0]['family_name'] = 'Englert'
+    assert [a['family_name'] for a in authors] == ['Ellis', 'Higgs',
+                                                   'Cranmer']
+    assert authors[2].schema is authors[0].schema
+
+    with pytest.raises(KeyError):
+        with data.validation as d:
+            del d['authors']
+            d['nowhere']
+    assert data['authors'] is authors
+    data.validate(incremental=True)
+
+    with data.validation as d:
+        with pytest.raises(ValidationError):
+            with d['authors'].validation as authors_:
+                authors_[0]['family_name'] = 'ellis'
+        d['authors'].pop()
+    assert [a['family_name'] for a in authors] == ['Ellis', 'Higgs']
+
+
+def test_nested_validation():
+    """Inner blocks are undone with the block that encloses them."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    data = JSONObject({'authors': [{'family_name': 'Ellis'}]}, schema=schema)
+
+    with pytest.raises(ValidationError):
+        with data.validation as d:
+            with d['authors'].validation as authors:
+                authors.append({'family_name': 'Higgs'})
+            d['authors'][0]['family_name'] = 'ellis'
+    assert data == {'authors': [{'family_name': 'Ellis'}]}
+
+    with data.validation as d:
+        d['authors'].append({'family_name': 'Higgs'})
+        transaction = d.validation
+        with transaction:
+            savepoint = transaction.savepoint()
+            d['authors'].append({'family_name': 'Cranmer'})
+            transaction.rollback(savepoint)
+            d['authors'][1]['family_name'] = 'Englert'
+    assert [a['family_name'] for a in data['authors']] == ['Ellis',
+                                                           'Englert']
+
+
+def test_batch(monkeypatch):
+    """Batches validate each value once and keep all changes or none."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    first = JSONObject({'authors': [{'family_name': 'Ellis'}]}, schema)
+    second = JSONObject({'authors': []}, schema)
+    calls = []
+    validate = JSONObject.validate
+    monkeypatch.setattr(JSONObject, 'validate', lambda self, **kwargs: (
+        calls.append(self), validate(self, **kwargs)))
+
+    with batch(first, second):
+        for name in ('Higgs', 'Englert', 'Cranmer'):
+            first['authors'].append({'family_name': name})
+            second['authors'].append({'family_name': name})
+    assert calls == [first, second]
+    assert len(first['authors']) == 4 and len(second['authors']) == 3
+
+    with pytest.raises(ValidationError):
+        with batch(first, second):
+            del first['authors'][0]
+            second['authors'][0]['family_name'] = 'higgs'
+    assert len(first['authors']) == 4
+    assert second['authors'][0]['family_name'] == 'Higgs'
+
+
 def test_array_append():
     """A JSONArray responds to the append method."""
     data = JSONArray([])
@@ -362,6 +460,80 @@ def test_insert_moves_schema():
         assert data[index].schema == data.schema['items'][index]
 
 
+@pytest.mark.parametrize('mutate', [
+    lambda data: data.pop(0),
+    lambda data: data.pop(-4),
+    lambda data: data.remove('Avenue'),
+    lambda data: data.__delitem__(1),
+    lambda data: data.__delitem__(slice(0, 2)),
+    lambda data: data.__delitem__(slice(None, None, 2)),
+    lambda data: data.__setitem__(slice(1, 2), ['Main', 'Street']),
+    lambda data: data.__setitem__(slice(None, None, 2), ['Main', 'NW']),
+    lambda data: data.extend(['NE', 'SW']),
+    lambda data: data.reverse(),
+    lambda data: data.sort(key=str),
+])
+def test_array_mutators_move_schemas(mutate):
+    """Items get the schema of the position they are moved to."""
+    schema = load_schema_from_url(abs_path('schemas/items_in_list.json'))
+    data = JSONArray([1, 'Washington', 'Avenue', 'NW'], schema)
+    value = list(data)
+
+    mutate(data)
+    mutate(value)
+
+    assert data == value
+    for index, item in enumerate(data):
+        if isinstance(item, (JSONString, JSONInteger)):
+            expected = schema['items'][index] if index < 4 else {}
+            assert item.schema == expected
+
+
+def test_array_splice():
+    """Splicing removes and adds items in one go."""
+    data = JSONArray(['a', 'b', 'c', 'd'])
+
+    assert data.splice(1, 2, ['x', 'y', 'z']) == ['b', 'c']
+    assert data == ['a', 'x', 'y', 'z', 'd']
+    assert all(isinstance(item, JSONString) for item in data)
+    assert data.splice(-1) == ['d']
+    assert data.splice(10, 1, ['e']) == []
+    assert data.splice(0, -1) == []
+    assert data == ['a', 'x', 'y', 'z', 'e']
+    with pytest.raises(IndexError):
+        JSONArray().pop()
+
+    schema = load_schema_from_url(abs_path('schemas/items_in_list.json'))
+    data = JSONArray([1, 'Washington', 'Avenue'], schema)
+    data.splice(1, 1, ['Main', 'Boulevard', 'SE'])
+    assert [item.schema for item in data] == schema['items'] + [{}]
+    with pytest.raises(IndexError):
+        del data[5]
+
+
+def test_insert_keeps_unchanged_schemas(monkeypatch):
+    """Only items whose schema changes get a new one."""
+    calls = []
+    set_schema = JSONString._set_schema
+    monkeypatch.setattr(JSONString, '_set_schema', lambda self, schema: (
+        calls.append(str(self)), set_schema(self, schema)))
+
+    data = JSONArray(['a'] * 100, {'items': {'type': 'string'}})
+    data.insert(0, 'b')
+    data[1:3] = ['c']
+    assert calls == []
+
+    schema = load_schema_from_url(abs_path('schemas/items_in_list.json'))
+    data = JSONArray([1] + ['x%d' % index for index in range(100)], schema)
+    data.insert(1, 'y')
+    assert calls == ['x0', 'x1', 'x2']
+    assert data[4].schema == {}
+    del calls[:]
+    data[1:3] = []
+    assert calls == ['x1', 'x2', 'x3']
+    assert data[3].schema == schema['items'][3]
+
+
 @pytest.mark.parametrize('i, j, added',
                          [(1, 3, ["Main", "Street", "NW"]),
                           (2, -1, ["Stret", "NW", "foo"]),
@@ -407,6 +579,231 @@ def test_setslice_deep_schema_change():
     data.validate()
 
 
+def test_from_json():
+    """Wrappers can be built from JSON documents."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    document = '{"authors": [{"family_name": "Higgs"}, ' \
+        '{"family_name": "Englert"}]}'
+
+    data = JSONObject.from_json(document.encode('utf-8'), schema)
+
+    assert isinstance(data['authors'][0]['family_name'], JSONString)
+    assert data['authors'][1]['family_name'] == 'Englert'
+    data.validate()
+
+    lazy = JSONObject.from_json(document, schema, lazy=True)
+    assert lazy['authors'][1]['family_name'] == 'Englert'
+    schema = compile_schema(schema)
+    authors = JSONArray.from_json('[{"family_name": "Higgs"}]',
+                                  schema['properties']['authors'])
+    assert authors[0]['family_name'].schema is \
+        schema['definitions']['family_name_definitions']
+
+    with pytest.raises(ValueError):
+        JSONObject.from_json('[]')
+    with pytest.raises(ValueError):
+        JSONArray.from_json('{}')
+
+
+def test_lazy_wrapping():
+    """Lazy wrappers wrap their values when they are first read."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    authors = [{'family_name': 'Higgs'}, {'family_name': 'Englert'}]
+
+    data = JSONObject({'authors': authors}, schema, lazy=True)
+
+    assert isinstance(data, JSONObject)
+    assert dict.__getitem__(data, 'authors') is authors
+    assert isinstance(data['authors'], JSONArray)
+    assert data['authors'] is data['authors']
+    assert list.__getitem__(data['authors'], 0) is authors[0]
+
+    family_names = [author['family_name'] for author in data['authors']]
+    assert family_names == ['Higgs', 'Englert']
+    assert isinstance(family_names[0], JSONString)
+    assert family_names[0].schema == \
+        schema['definitions']['family_name_definitions']
+    assert family_names[0].parent.parent is data['authors']
+    assert family_names[0].root is data
+    assert data['authors'][1:] == [{'family_name': 'Englert'}]
+
+    data.validate()
+    data['authors'].append({'family_name': 'e'})
+    with pytest.raises(ValidationError):
+        data.validate()
+
+
+def test_compact_wrapping():
+    """Compact wrappers keep scalars as plain values."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+
+    data = JSONObject({'authors': [{'family_name': 'Higgs',
+                                    'given_name': 'Peter'}]},
+                      schema, compact=True)
+
+    author = data['authors'][0]
+    assert isinstance(author, JSONObject)
+    assert author.parent is data['authors']
+    assert type(author['family_name']) is str
+    assert author.child_schema('family_name') == \
+        schema['definitions']['family_name_definitions']
+
+    data['authors'].append({'family_name': 'Englert'})
+    assert type(data['authors'][1]['family_name']) is str
+
+    result = data.search('authors[*].family_name')
+    assert result == ['Higgs', 'Englert']
+    assert isinstance(result[0], JSONString)
+    assert result[0].parent is author
+    assert result[0].schema == author.child_schema('family_name')
+
+    data.validate()
+    author['given_name'] = 'peter'
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate()
+    assert "start with an uppercase" in str(excinfo.value)
+
+    with pytest.raises(ValueError):
+        JSONArray([], lazy=True, compact=True)
+
+
+def test_view():
+    """Views read the wrapped data in place."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    raw = {'authors': [{'family_name': 'Higgs', 'given_name': 'Peter'},
+                       {'family_name': 'Englert'}]}
+
+    view = JSONView(raw, schema)
+
+    assert view['authors']._data is raw['authors']
+    assert view['authors'] is view['authors']
+    assert view['authors'][-1] is view['authors'][1]
+    assert view['authors'][1] == {'family_name': 'Englert'}
+    family_name = view['authors'][0]['family_name']
+    assert isinstance(family_name, JSONString)
+    assert family_name.schema == \
+        schema['definitions']['family_name_definitions']
+    assert family_name.parent.parent is view['authors']
+    assert family_name.root is view
+    assert len(view['authors']) == 2
+    assert 'authors' in view
+
+    result = view.search('authors[*].family_name')
+    assert result == ['Higgs', 'Englert']
+    assert result[1].parent is view['authors'][1]
+
+    with pytest.raises(TypeError):
+        view['authors'] = []
+
+    view.validate()
+    raw['authors'][0]['given_name'] = 'peter'
+    with pytest.raises(ValidationError) as excinfo:
+        view.validate()
+    assert "start with an uppercase" in str(excinfo.value)
+
+
+def test_view_decoded_json():
+    """Views validate data straight from the JSON decoder."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    raw = json.loads('{"authors": [{"family_name": "Higgs", '
+                     '"given_name": "Peter"}]}')
+
+    view = JSONView(raw, schema)
+
+    view.validate()
+    assert view['authors'][0]['given_name'] == 'Peter'
+    raw['authors'][0]['affiliation'] = 1
+    with pytest.raises(ValidationError) as excinfo:
+        view.validate()
+    assert 'is not of type' in str(excinfo.value)
+
+
+def test_view_calculated_fields():
+    """Views compute calculated fields from the wrapped data."""
+    schema = load_schema_from_url(abs_path('schemas/memoized.json'))
+
+    view = JSONView({'authors': [{'family_name': 'Higgs'},
+                                 {'family_name': 'Englert'}]}, schema)
+
+    assert view['author_names'] == 'Higgs; Englert'
+    assert view['author_names'] is view['author_names']
+
+
+@pytest.mark.parametrize('options', [{}, {'lazy': True},
+                                     {'compact': True}])
+def test_to_json(options):
+    """Wrappers serialize to compact JSON, with calculated fields or not."""
+    schema = load_schema_from_url(abs_path('schemas/template.json'))
+    value = {'first_name': 'John', 'last_name': u'\xc9llis',
+             'friends': [{'first_name': 'Jerry'}, 1.5, None, True]}
+    data = JSONObject(value, schema, **options)
+    data['full_name'] = 'John Smith'
+
+    assert json.loads(data.to_json()) == value
+    assert ' ' not in data.to_json()
+    computed = json.loads(data.to_json(include_computed=True))
+    assert computed == dict(value, full_name=u'John \xc9llis')
+    assert json.loads(data['friends'].to_json()) == value['friends']
+    assert dumps(data['first_name']) == '"John"'
+
+    stream = io.StringIO()
+    assert data.to_json(include_computed=True, stream=stream) is None
+    assert json.loads(stream.getvalue()) == computed
+    assert json.loads(JSONView(value, schema).to_json()) == value
+
+
+def test_dumps_deep_document():
+    """Deep documents are serialized without recursion."""
+    depth = 10000
+    value = []
+    for _ in range(depth):
+        value = [value]
+
+    assert dumps(JSONView(value)) == '[' * (depth + 1) + ']' * (depth + 1)
+    assert dumps({'a': [1, {'b': None}]}) == '{"a":[1,{"b":null}]}'
+    with pytest.raises(ValueError):
+        dumps([float('nan')])
+    with pytest.raises(TypeError):
+        dumps([object()])
+
+
+@pytest.mark.parametrize('options', [{}, {'lazy': True},
+                                     {'compact': True}])
+def test_to_python(options):
+    """Wrappers are turned into plain builtins."""
+    schema = load_schema_from_url(abs_path('schemas/template.json'))
+    value = {'first_name': 'John', 'last_name': 'Ellis',
+             'friends': [{'first_name': 'Jerry'}, 1.5, 2, None, True]}
+    data = JSONObject(value, schema, **options)
+
+    plain = data.to_python()
+    assert plain == value
+    assert type(plain) is dict
+    assert type(plain['first_name']) is str
+    assert type(plain['friends']) is list
+    assert type(plain['friends'][0]) is dict
+    assert [type(item) for item in plain['friends'][1:]] == [
+        float, int, type(None), bool]
+    assert data.to_python(include_computed=True)['full_name'] == 'John Ellis'
+    assert 'full_name' not in plain
+    assert type(JSONString('a').to_python()) is str
+    assert JSONView(value, schema).to_python() == value
+
+
+def test_unwrap_deep_document():
+    """Deep documents are unwrapped without recursion."""
+    value = inner = []
+    for _ in range(10000):
+        inner.append({'a': []})
+        inner = inner[0]['a']
+
+    plain = unwrap(JSONView(value))
+    for _ in range(10000):
+        assert type(plain) is list and type(plain[0]) is dict
+        plain = plain[0]['a']
+    assert plain == []
+
+
 def test_descriptions_as_docstrings():
     """Description fields become docstrings."""
     data = JSONObject({}, {'description': 'docstring'})
@@ -487,6 +884,78 @@ def test_derived_fields_dict():
     assert data['full_name'] == 'Jerry Ellis'
 
 
+def test_derived_fields_memoized():
+    """Memoized derived fields are rendered again only after changes."""
+    schema = load_schema_from_url(abs_path('schemas/template.json'))
+    schema['properties']['full_name']['memoize'] = True
+
+    data = JSONObject({'first_name': 'John', 'last_name': 'Ellis'},
+                      schema=schema)
+
+    assert data['full_name'] == 'John Ellis'
+    assert data['full_name'] is data['full_name']
+    data['first_name'] = 'Jerry'
+    assert data['full_name'] == 'Jerry Ellis'
+    assert get_template('{{fname}} {{lname}}') is \
+        get_template('{{fname}} {{lname}}')
+
+
+def test_calculated_fields_memoized():
+    """Memoized calculated fields are invalidated by their dependencies."""
+    schema = load_schema_from_url(abs_path('schemas/memoized.json'))
+
+    data = JSONObject({'title': 'Higgs boson',
+                       'authors': [{'family_name': 'Higgs'}]}, schema)
+
+    names = data['author_names']
+    assert names == 'Higgs'
+    assert data['author_names'] is names
+
+    data['title'] = 'Broken symmetries'
+    assert data['author_names'] is names
+
+    data['authors'].append({'family_name': 'Englert'})
+    assert data['author_names'] == 'Higgs; Englert'
+
+    data['authors'][0]['family_name'] = 'Brout'
+    assert data['author_names'] == 'Brout; Englert'
+
+    data['authors'] = []
+    assert data['author_names'] == ''
+
+
+def test_memoized_mutators():
+    """Every mutation of a dependency invalidates memoized fields."""
+    schema = load_schema_from_url(abs_path('schemas/memoized.json'))
+    data = JSONObject({'authors': [{'family_name': 'A'},
+                                   {'family_name': 'B'},
+                                   {'family_name': 'C'}]}, schema)
+    authors = data['authors']
+
+    assert data['author_names'] == 'A; B; C'
+    authors.reverse()
+    assert data['author_names'] == 'C; B; A'
+    authors.pop()
+    assert data['author_names'] == 'C; B'
+    del authors[0]
+    assert data['author_names'] == 'B'
+    authors += [{'family_name': 'D'}]
+    assert data['author_names'] == 'B; D'
+    authors.sort(key=lambda author: author['family_name'], reverse=True)
+    assert data['author_names'] == 'D; B'
+    authors.remove({'family_name': 'B'})
+    assert data['author_names'] == 'D'
+    authors[0].update(family_name='E')
+    assert data['author_names'] == 'E'
+    assert isinstance(authors[0]['family_name'], JSONString)
+    authors[0].pop('family_name')
+    authors[0].setdefault('family_name', 'F')
+    assert data['author_names'] == 'F'
+    authors[0].clear()
+    with pytest.raises(KeyError):
+        data['author_names']
+
+
 def test_invalid_getter_and_setter():
     schema = load_schema_from_url(
         abs_path('schemas/invalid_getter_and_setter.json'))
@@ -518,6 +987,96 @@ def test_external_validation():
     assert "start with an uppercase" in str(excinfo.value)
 
 
+def test_incremental_validation(monkeypatch):
+    """Incremental validation only checks what changed."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    schema['required'] = ['authors']
+    schema['properties']['authors']['minItems'] = 1
+    data = JSONObject({'authors': [{'given_name': 'Peter'},
+                                   {'given_name': 'Francois'}]}, schema)
+    checked = []
+    monkeypatch.setattr(helpers, 'isCorrectName', checked.append)
+    clear_import_cache()
+
+    data.validate(incremental=True)
+    assert len(checked) == 2
+    data.validate(incremental=True)
+    assert len(checked) == 2
+
+    data['authors'][1]['given_name'] = 'Fran'
+    data.validate(incremental=True)
+    assert checked[2:] == ['Fran']
+
+    data['authors'].append({'given_name': 'Robert'})
+    data.validate(incremental=True)
+    assert checked[3:] == ['Robert']
+
+    data['authors'][0]['given_name'] = 1
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate(incremental=True)
+    assert list(excinfo.value.path) == ['authors', 0, 'given_name']
+    data['authors'][0]['given_name'] = 'Peter'
+
+    del data['authors'][:]
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate(incremental=True)
+    assert 'is too short' in str(excinfo.value)
+
+    del data['authors']
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate(incremental=True)
+    assert 'is a required property' in str(excinfo.value)
+    clear_import_cache()
+
+
+def test_incremental_validation_compact():
+    """Plain values of compact wrappers are checked incrementally."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    data = JSONObject({'authors': [{'given_name': 'Peter'}]}, schema,
+                      compact=True)
+    data.validate()
+
+    data['authors'][0]['given_name'] = 'peter'
+    with pytest.raises(ValidationError) as excinfo:
+        data.validate(incremental=True)
+    assert 'start with an uppercase' in str(excinfo.value)
+    assert list(excinfo.value.path) == ['authors', 0, 'given_name']
+
+
+def test_validation_report():
+    """Reports hold every schema and external error with its pointer."""
+    schema = load_schema_from_url(abs_path('schemas/complex.json'))
+    raw = {'authors': [{'family_name': 'higgs', 'affiliation': 'C'},
+                       {'family_name': 1, 'given_name': 'francois'}]}
+
+    for data in (JSONObject(raw, schema), JSONView(raw, schema)):
+        report = data.validation_report()
+
+        pointers = sorted(pointer for pointer, error in report)
+        assert pointers == ['/authors/0/affiliation',
+                            '/authors/0/family_name',
+                            '/authors/1/family_name',
+                            '/authors/1/given_name']
+        assert all(isinstance(error, ValidationError) for
+                   pointer, error in report)
+        messages = dict(report)
+        assert 'start with an uppercase' in \
+            str(messages['/authors/0/family_name'])
+        assert 'is not of type' in str(messages['/authors/1/family_name'])
+
+    assert JSONObject({'authors': []}, schema).validation_report() == []
+
+
+def test_validation_report_enum():
+    """Reports include enumSource misses."""
+    schema = load_schema_from_url(abs_path('schemas/enum.json'))
+
+    report = JSONObject({'enumed_field': 3}, schema).validation_report()
+
+    assert [pointer for pointer, error in report] == ['/enumed_field']
+    assert 'is not in enum' in str(report[0][1])
+
+
 def test_invalid_external_validation():
     schema = load_schema_from_url(
         abs_path('schemas/invalid_external_validation.json'))
@@ -566,7 +1125,7 @@ def test_invalid_ref():
     schema = load_schema_from_url(abs_path('schemas/complex.json'))
 
     schema['properties']['authors']['items'][
-           'properties']['family_name']['$ref'] = '#'
+           'properties']['family_name']['$ref'] = '#/nowhere'
 
     with pytest.raises(KeyError) as excinfo:
         data = JSONObject({
@@ -602,11 +1161,8 @@ def test_external_ref():
     schema['properties']['authors']['items']['properties'][
            'family_name']['$ref'] = "http://www.no.com"
 
-    data = JSONObject({
-        'authors': [{'family_name': 'Ellis'}]
-    }, schema=schema)
-
-    assert data['authors'][0]['family_name'].schema == {}
+    with pytest.raises(RefResolutionError):
+        JSONObject({'authors': [{'family_name': 'Ellis'}]}, schema=schema)
 
 
 def test_enum():